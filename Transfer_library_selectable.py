@@ -1,332 +1,1239 @@
-import tidalapi
-from tidalapi.exceptions import TidalAPIError
-from tqdm import tqdm
-import os
-import json
-import sys
-
-# ─────────────────────────────────────────────
-# CONFIGURATION
-# ─────────────────────────────────────────────
-FAILED_LOG_FILE = "failed_items.txt"
-PLAYLIST_EXPORT_FILE = "playlists_export.json"
-SEPARATOR = " :: "  # Separator oddzielający ID od nazwy w plikach txt
-
-# Słownik przechowujący nazwy dla ID (Globalny Cache)
-meta_cache = {}
-
-# Initialize error log file
-with open(FAILED_LOG_FILE, "w", encoding="utf-8") as f:
-    f.write("Failed Transfer Report:\n=======================\n")
-
-# ─────────────────────────────────────────────
-# PAGINATION (Universal)
-# ─────────────────────────────────────────────
-def fetch_all(fetch_fn, count_fn, label, page_size=50):
-    try:
-        total = count_fn()
-    except:
-        total = 0
-        
-    print(f'  Found {total} {label}.')
-
-    if total == 0:
-        return []
-
-    items = []
-    with tqdm(total=total, desc=f'  Downloading {label}', unit='items') as pbar:
-        offset = 0
-        while offset < total:
-            batch = fetch_fn(limit=page_size, offset=offset)
-            if not batch:
-                break
-            items.extend(batch)
-            offset += len(batch)
-            pbar.update(len(batch))
-    return items
-
-# ─────────────────────────────────────────────
-# HELPERS
-# ─────────────────────────────────────────────
-def get_artist_name(item):
-    if hasattr(item, 'artist') and item.artist:
-        return item.artist.name
-    return "Unknown Artist"
-
-def get_album_name(item):
-    if hasattr(item, 'album') and item.album:
-        return item.album.name
-    return "Unknown Album"
-
-def log_error(info, error_msg):
-    tqdm.write(f"\n[ERROR] Failed: {info}")
-    with open(FAILED_LOG_FILE, "a", encoding="utf-8") as log:
-        log.write(f"{info}\n   -> Reason: {error_msg}\n")
-
-# ─────────────────────────────────────────────
-# MENU - MODE SELECTION
-# ─────────────────────────────────────────────
-print("\nSelect Mode:")
-print("1 - Full Transfer (Login Source -> Export -> Login destination account -> Import)")
-print("2 - Export Only (Login Source -> Save to files -> Exit)")
-print("3 - Import Only (Skip Source login, use local files)")
-
-mode_choice = input("Enter mode (1/2/3): ").strip()
-
-enable_export = mode_choice in ("1", "2")
-enable_import = mode_choice in ("1", "3")
-
-# ─────────────────────────────────────────────
-# MENU - CONTENT SELECTION
-# ─────────────────────────────────────────────
-print("\nWhat content should be processed?")
-print("1 - Favorite Tracks")
-print("2 - Albums")
-print("3 - Artists")
-print("4 - Playlists")
-print("5 - Everything")
-
-choice = input("Enter number: ").strip()
-
-transfer_tracks = choice in ("1", "5")
-transfer_albums = choice in ("2", "5")
-transfer_artists = choice in ("3", "5")
-transfer_playlists = choice in ("4", "5")
-
-# ─────────────────────────────────────────────
-# LOGIN SOURCE & EXPORT (Conditional)
-# ─────────────────────────────────────────────
-if enable_export:
-    session1 = tidalapi.Session()
-    print('\n=== Login to SOURCE account (Export from) ===')
-    session1.login_oauth_simple()
-    source = session1.user.favorites
-
-    print('\n--- EXPORTING DATA (Saving IDs and Names) ---')
-
-    # --- 1. ALBUMS ---
-    if transfer_albums:
-        albums = fetch_all(source.albums, source.get_albums_count, "albums")
-        albums.sort(key=lambda x: x.user_date_added or 0)
-        with open("album_id_list.txt", "w", encoding="utf-8") as f:
-            for item in albums:
-                meta = f"Album: {item.name} | Artist: {get_artist_name(item)}"
-                # Zapisujemy w formacie: ID :: Metadata
-                f.write(f"{item.id}{SEPARATOR}{meta}\n")
-                meta_cache[str(item.id)] = meta
-
-    # --- 2. ARTISTS ---
-    if transfer_artists:
-        artists = fetch_all(source.artists, source.get_artists_count, "artists")
-        artists.sort(key=lambda x: x.user_date_added or 0)
-        with open("artist_id_list.txt", "w", encoding="utf-8") as f:
-            for item in artists:
-                meta = f"Artist: {item.name}"
-                f.write(f"{item.id}{SEPARATOR}{meta}\n")
-                meta_cache[str(item.id)] = meta
-
-    # --- 3. TRACKS (FAVORITES) ---
-    if transfer_tracks:
-        tracks = fetch_all(source.tracks, source.get_tracks_count, "favorite tracks")
-        tracks.sort(key=lambda x: x.user_date_added or 0)
-        with open("track_id_list.txt", "w", encoding="utf-8") as f:
-            for item in tracks:
-                meta = f"Track: {item.name} | Artist: {get_artist_name(item)}"
-                f.write(f"{item.id}{SEPARATOR}{meta}\n")
-                meta_cache[str(item.id)] = meta
-
-    # --- 4. PLAYLISTS (FULL EXPORT) ---
-    if transfer_playlists:
-        print("\n  Fetching playlists...")
-        playlists = fetch_all(source.playlists, source.get_playlists_count, "playlists")
-        
-        playlists_data = []
-        
-        print("  Analyzing playlist content...")
-        for pl in tqdm(playlists, desc="Scanning playlists"):
-            try:
-                pl_items = []
-                offset = 0
-                while True:
-                    batch = pl.items(limit=100, offset=offset)
-                    if not batch: break
-                    pl_items.extend(batch)
-                    offset += len(batch)
-                
-                # Zbieramy utwory jako obiekty {id, meta}
-                track_objects = []
-                for item in pl_items:
-                    if hasattr(item, 'id'):
-                        artist_name = "Unknown"
-                        if hasattr(item, 'artist') and item.artist:
-                            artist_name = item.artist.name
-                        
-                        meta_info = f"{item.name} - {artist_name}"
-                        track_objects.append({
-                            "id": str(item.id),
-                            "meta": meta_info
-                        })
-                        
-                        # Cache'ujemy też lokalnie
-                        meta_cache[str(item.id)] = f"Track in PL '{pl.name}': {meta_info}"
-
-                playlists_data.append({
-                    "name": pl.name,
-                    "description": pl.description,
-                    "tracks": track_objects # Zapisujemy pełne obiekty
-                })
-            except Exception as e:
-                print(f"  [WARN] Failed to fetch content for playlist {pl.name}: {e}")
-
-        with open(PLAYLIST_EXPORT_FILE, "w", encoding="utf-8") as f:
-            json.dump(playlists_data, f, ensure_ascii=False, indent=4)
-
-    print("\nData exported successfully with Metadata.")
-
-# Check if we should stop here (Export Only mode)
-if not enable_import:
-    print("\n--- EXPORT ONLY MODE FINISHED ---")
-    print("Files saved locally with titles/artists. Exiting.")
-    input("Press Enter to exit...")
-    sys.exit()
-
-# If we are in Import Only mode, check files
-if enable_import and not enable_export:
-    print("\n--- SKIPPING EXPORT (Loading from local files) ---")
-    files_to_check = []
-    if transfer_albums: files_to_check.append("album_id_list.txt")
-    if transfer_artists: files_to_check.append("artist_id_list.txt")
-    if transfer_tracks: files_to_check.append("track_id_list.txt")
-    if transfer_playlists: files_to_check.append(PLAYLIST_EXPORT_FILE)
-    
-    missing = [f for f in files_to_check if not os.path.exists(f)]
-    if missing:
-        print(f"[WARNING] The following files are missing: {missing}")
-        input("Press Enter to continue anyway...")
-
-
-# ─────────────────────────────────────────────
-# LOGIN DESTINATION
-# ─────────────────────────────────────────────
-session2 = tidalapi.Session()
-print('\n=== Login to DESTINATION account (Import to) ===')
-session2.login_oauth_simple()
-dest = session2.user.favorites
-
-
-# ─────────────────────────────────────────────
-# IMPORT FUNCTION (Simple Items with Metadata Parsing)
-# ─────────────────────────────────────────────
-def add_simple_items(filename, add_fn, label):
-    if not os.path.exists(filename):
-        print(f"File {filename} not found. Skipping {label}.")
-        return
-
-    # Wczytujemy linie
-    with open(filename, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-
-    ids_to_process = []
-    
-    # Parsujemy plik: oddzielamy ID od Metadanych
-    for line in lines:
-        line = line.strip()
-        if not line: continue
-        
-        # Sprawdzamy czy linia ma separator " :: "
-        if SEPARATOR in line:
-            parts = line.split(SEPARATOR, 1)
-            item_id = parts[0].strip()
-            meta_info = parts[1].strip()
-            
-            # Zapisujemy metadane do cache, żeby log_error mógł ich użyć
-            meta_cache[item_id] = meta_info
-            ids_to_process.append(item_id)
-        else:
-            # Stary format (tylko ID) - kompatybilność wsteczna
-            item_id = line.strip()
-            ids_to_process.append(item_id)
-
-    print(f"\nAdding {label}...")
-    for item_id in tqdm(ids_to_process):
-        try:
-            add_fn(item_id)
-        except Exception as e:
-            # Pobieramy nazwę z cache (którą przed chwilą wczytaliśmy z pliku)
-            info = meta_cache.get(str(item_id), f"ID: {item_id} (No metadata in file)")
-            log_error(info, e)
-
-
-# ─────────────────────────────────────────────
-# IMPORT FUNCTION (Playlists with Metadata Parsing)
-# ─────────────────────────────────────────────
-def import_playlists_cloned():
-    if not os.path.exists(PLAYLIST_EXPORT_FILE):
-        print(f"File {PLAYLIST_EXPORT_FILE} not found. Skipping playlists.")
-        return
-
-    with open(PLAYLIST_EXPORT_FILE, "r", encoding="utf-8") as f:
-        playlists_data = json.load(f)
-
-    print(f"\nCloning {len(playlists_data)} playlists...")
-
-    for pl_data in tqdm(playlists_data, desc="Creating playlists"):
-        pl_name = pl_data['name']
-        pl_desc = pl_data.get('description', '')
-        raw_tracks = pl_data.get('tracks', []) # To jest teraz lista słowników lub stringów
-
-        try:
-            new_pl = session2.user.create_playlist(pl_name, pl_desc)
-            
-            if not raw_tracks:
-                continue
-            
-            # Przygotowanie listy ID i Cache'a
-            track_ids_only = []
-            
-            for t in raw_tracks:
-                if isinstance(t, dict):
-                    # Nowy format JSON: {"id": "...", "meta": "..."}
-                    tid = t['id']
-                    meta = t['meta']
-                    meta_cache[tid] = f"Track: {meta} (in PL '{pl_name}')"
-                    track_ids_only.append(tid)
-                else:
-                    # Stary format JSON: "12345" (string)
-                    track_ids_only.append(t)
-
-            # Próba dodania
-            try:
-                new_pl.add(track_ids_only)
-            except Exception as e:
-                tqdm.write(f"  Batch add failed for '{pl_name}', trying one by one...")
-                for tid in track_ids_only:
-                    try:
-                        new_pl.add([tid])
-                    except Exception as inner_e:
-                        info = meta_cache.get(tid, f"Track ID: {tid} in playlist '{pl_name}'")
-                        log_error(info, inner_e)
-
-        except Exception as e:
-            tqdm.write(f"  [CRITICAL] Failed to create playlist '{pl_name}'")
-            log_error(f"Entire Playlist: {pl_name}", e)
-
-# ─────────────────────────────────────────────
-# RUN IMPORT
-# ─────────────────────────────────────────────
-
-if transfer_albums:
-    add_simple_items("album_id_list.txt", dest.add_album, "albums")
-
-if transfer_artists:
-    add_simple_items("artist_id_list.txt", dest.add_artist, "artists")
-
-if transfer_playlists:
-    import_playlists_cloned()
-
-if transfer_tracks:
-    add_simple_items("track_id_list.txt", dest.add_track, "favorite tracks")
-
-print("\nProcess Completed!")
-print(f"Check '{FAILED_LOG_FILE}' for any failed items.")
+from tidalapi.exceptions import TidalAPIError, ObjectNotFound
+from tidalapi.types import AlbumOrder, ArtistOrder, ItemOrder, OrderDirection
+from tqdm import tqdm
+import os
+import json
+import hashlib
+import re
+import sys
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from tidal_utils import fetch_all, iter_pages, prefetch_pages, paged, ordered_map, RateLimiter, run_bulk, send_batch, is_transient, http_status
+from tidal_utils import Journal, JournalState, load_journal
+from tidal_utils import login, MetaIndex, call_with_retry, playlist_diff, apply_playlist_diff, count_moves, add_to_playlist
+from tidal_utils import metrics, MatchCache, Rematcher
+from tidal_archive import open_archive, write_items, write_playlists, iter_items, iter_playlists
+from tidal_archive import count_items, has_rows, get_meta, mark_items, mark_playlist, TEXT_FILES
+from tidal_archive import playlist_key, iter_playlist_export, read_text_rows
+
+# ─────────────────────────────────────────────
+# CONFIGURATION
+# ─────────────────────────────────────────────
+FAILED_LOG_FILE = "failed_items.jsonl"  # One JSON record per failure, read by Retry Failed mode
+PLAYLIST_EXPORT_FILE = "playlists_export.json"
+PLAYLIST_STREAM_FILE = "playlists_export.jsonl"  # Streaming export: one playlist per line
+JOURNAL_FILE = "transfer_journal.jsonl"  # Progress of the last run, used by --resume
+PLAYLIST_SYNC_FILE = "playlist_sync_map.json"  # Source playlist -> destination playlist, for Sync
+WATERMARK_FILE = "export_watermark.json"  # Newest exported favorite per file, for incremental export
+SEPARATOR = " :: "  # Separator oddzielający ID od nazwy w plikach txt
+PAGE_SIZE = 50      # Items per page when downloading lists
+FETCH_WORKERS = 4   # Parallel page requests (1 = sequential)
+IMPORT_WORKERS = 4  # Parallel add requests on the destination account
+RATE_LIMIT = 10     # Max requests per second to each account
+MAX_RETRIES = 5     # Retries for 429 / server errors before giving up on an item
+KEEP_ORDER = True   # Keep date-added order of favorites (sends in small windows)
+ORDER_WINDOW = 4    # Requests sent at once when KEEP_ORDER is on (batches, or items when BATCH_SIZE = 1)
+BATCH_SIZE = 50     # IDs sent in one favorites request (1 = one request per item)
+PLAYLIST_CHUNK = 100   # Tracks added to a playlist in one request (max 100)
+PLAYLIST_WORKERS = 3   # Playlists filled at the same time
+SCAN_WORKERS = 4       # Source playlists read at the same time during export
+PIPELINE_QUEUE = 500   # Pipelined mode: exported items waiting for import (keeps memory bounded)
+STREAM_EXPORT = False  # Write export files page by page while downloading (playlists as JSONL)
+USE_ARCHIVE = False    # Export to / import from one SQLite file instead of the txt/JSON files
+ARCHIVE_FILE = "library_archive.db"
+SOURCE_PROFILE = "source"        # Saved login names in tidal_sessions.json
+DEST_PROFILE = "destination"
+METRICS_FILE = "transfer_metrics.jsonl"  # API latency / throughput of every run, one JSON line per run
+METRICS_PROM_FILE = ""  # Prometheus textfile, e.g. "/var/lib/node_exporter/textfile/tidal_transfer.prom"
+REMATCH = True         # Look up tracks / albums that can't be added by ISRC / UPC, then by title and artist
+MATCH_CACHE_FILE = "rematch_cache.json"  # Lookup results kept between runs
+MATCH_CACHE_DAYS = 30  # Cached lookups older than this are repeated
+
+# Plik tekstowy -> tabela w archiwum SQLite
+ARCHIVE_TABLES = {filename: table for table, filename in TEXT_FILES.items()}
+
+# Nazwy dla ID czytamy z pliku eksportu dopiero przy błędzie (plik -> MetaIndex)
+meta_indexes = {}
+
+# Log błędów otwieramy dopiero przed importem (Retry Failed czyta najpierw poprzedni)
+failure_log = None
+
+# ─────────────────────────────────────────────
+# HELPERS
+# ─────────────────────────────────────────────
+def get_artist_name(item):
+    if hasattr(item, 'artist') and item.artist:
+        return item.artist.name
+    return "Unknown Artist"
+
+def get_album_name(item):
+    if hasattr(item, 'album') and item.album:
+        return item.album.name
+    return "Unknown Album"
+
+def lookup_meta(filename, item_id):
+    if archive is not None:
+        return get_meta(archive, ARCHIVE_TABLES[filename], item_id)
+    if filename not in meta_indexes:
+        meta_indexes[filename] = MetaIndex(filename, SEPARATOR)
+    return meta_indexes[filename].get(item_id)
+
+META_PATTERN = re.compile(r"^(?:Track|Album|Artist): (.*?)(?: \| Artist: (.*?))?(?: \| (?:ISRC|UPC): (\S+))?$")
+
+def meta_codes(meta):
+    # "Track: Title | Artist: Name | ISRC: CODE" -> (code, title, artist)
+    match = META_PATTERN.match(meta or "")
+    if not match:
+        return None, None, None
+    title, artist, code = match.groups()
+    return code, title, artist
+
+def playlist_track_codes(track):
+    # Track object from the playlist export -> (code, title, artist), meta is "Title - Artist"
+    if not isinstance(track, dict):
+        return None, None, None
+    title, _, artist = (track.get('meta') or "").rpartition(" - ")
+    return track.get('isrc'), title or None, artist or None
+
+def log_error(info, error, category, item_id, **context):
+    # context: playlist, playlist_key, dest_playlist, position for playlist failures
+    tqdm.write(f"\n[ERROR] Failed: {info}")
+    failure_log.record(category=category, id=item_id, info=info, error=type(error).__name__,
+                       message=str(error), status=http_status(error),
+                       attempts=getattr(error, 'attempts', 1), transient=is_transient(error), **context)
+
+def load_failures(path):
+    # After --resume the log can hold the same item twice (it failed in both
+    # runs), the later record wins so nothing is retried twice
+    records = {}
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                r = json.loads(line)
+            except ValueError:
+                continue  # Ostatnia linia mogła zostać ucięta
+            records[(r.get("category"), r.get("id"), r.get("playlist_key"), r.get("position"))] = r
+    return list(records.values())
+
+# ─────────────────────────────────────────────
+# EXPORT FUNCTIONS
+# ─────────────────────────────────────────────
+def describe_album(item):
+    upc = getattr(item, 'upc', None)
+    return f"Album: {item.name} | Artist: {get_artist_name(item)}" + (f" | UPC: {upc}" if upc else "")
+
+def describe_artist(item):
+    return f"Artist: {item.name}"
+
+def describe_track(item):
+    isrc = getattr(item, 'isrc', None)
+    return f"Track: {item.name} | Artist: {get_artist_name(item)}" + (f" | ISRC: {isrc}" if isrc else "")
+
+def export_simple(filename, fetch_fn, count_fn, label, describe, order, stream=None, on_item=None):
+    stream = STREAM_EXPORT if stream is None else stream
+    if stream:
+        # Serwer sortuje od najstarszych, więc strony idą od razu do pliku
+        fetch_fn = partial(fetch_fn, order=order, order_direction=OrderDirection.Ascending)
+        pages = iter_pages(fetch_fn, count_fn, label, PAGE_SIZE, FETCH_WORKERS, limiter=source_limiter)
+    else:
+        items = fetch_all(fetch_fn, count_fn, label, PAGE_SIZE, FETCH_WORKERS, limiter=source_limiter)
+        items.sort(key=lambda x: x.user_date_added or 0)
+        pages = [items]
+
+    newest = None
+    ids = IdHash()  # For the watermark, the IDs themselves are not kept
+    def page_rows():
+        nonlocal newest
+        for page in pages:
+            rows = []
+            for item in page:
+                meta = describe(item)
+                rows.append((str(item.id), meta))
+                if on_item:
+                    on_item(str(item.id), meta)
+                ids.add(str(item.id))
+                if item.user_date_added and (newest is None or item.user_date_added > newest):
+                    newest = item.user_date_added
+            yield rows
+
+    if archive is not None:
+        write_items(archive, ARCHIVE_TABLES[filename], (row for rows in page_rows() for row in rows))
+        return newest, ids
+
+    with open(filename, "w", encoding="utf-8") as f:
+        for rows in page_rows():
+            for item_id, meta in rows:
+                # Zapisujemy w formacie: ID :: Metadata
+                f.write(f"{item_id}{SEPARATOR}{meta}\n")
+            f.flush()
+    return newest, ids
+
+def playlist_size(pl):
+    return (getattr(pl, 'num_tracks', 0) or 0) + (getattr(pl, 'num_videos', 0) or 0)
+
+def iter_playlist_items(pl, page_pool=None):
+    total = playlist_size(pl)
+    fetch_fn = paged(pl.items, source_limiter, MAX_RETRIES)
+    if page_pool and total:
+        # Znamy liczbę utworów, więc strony pobieramy równolegle
+        yield from prefetch_pages(fetch_fn, total, page_pool, 100, FETCH_WORKERS)
+        return
+    offset = 0
+    while True:
+        batch = fetch_fn(limit=100, offset=offset)
+        if not batch: break
+        yield batch
+        offset += len(batch)
+
+def export_playlist(pl, page_pool=None, track_bar=None):
+    # Zbieramy utwory jako obiekty {id, meta}
+    track_objects = []
+    for batch in iter_playlist_items(pl, page_pool):
+        if track_bar is not None:
+            track_bar.update(len(batch))
+        for item in batch:
+            if hasattr(item, 'id'):
+                artist_name = "Unknown"
+                if hasattr(item, 'artist') and item.artist:
+                    artist_name = item.artist.name
+                
+                meta_info = f"{item.name} - {artist_name}"
+                track = {
+                    "id": str(item.id),
+                    "meta": meta_info
+                }
+                # ISRC pozwala znaleźć ten sam utwór, gdy ID nie działa na koncie docelowym
+                if getattr(item, 'isrc', None):
+                    track["isrc"] = item.isrc
+                track_objects.append(track)
+
+
+    return {
+        "id": str(pl.id),
+        "name": pl.name,
+        "description": pl.description,
+        "tracks": track_objects # Zapisujemy pełne obiekty
+    }
+
+def scan_playlists(playlists, tracks_total=None):
+    # Yields (pl, record, error) in the original order. SCAN_WORKERS playlists
+    # are read at the same time and each of them fetches its pages in parallel.
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as page_pool, \
+            tqdm(total=tracks_total, desc="  Scanning tracks", unit='tracks', position=1) as track_bar:
+        def scan(pl):
+            try:
+                return pl, export_playlist(pl, page_pool, track_bar), None
+            except Exception as e:
+                return pl, None, e
+        yield from ordered_map(scan, playlists, SCAN_WORKERS)
+        metrics.record_phase("Scanning tracks", track_bar.n, started)
+
+def export_playlists_stream(source, on_record=None):
+    def records():
+        pages = iter_pages(source.playlists, source.get_playlists_count, "playlists", PAGE_SIZE, FETCH_WORKERS,
+                           limiter=source_limiter)
+        for pl, record, error in scan_playlists(pl for page in pages for pl in page):
+            if error is not None:
+                tqdm.write(f"  [WARN] Failed to fetch content for playlist {pl.name}: {error}")
+                continue
+            yield record
+            if on_record:
+                on_record(record)
+
+    if archive is not None:
+        write_playlists(archive, records())
+        return
+
+    # Każda playlista trafia do pliku od razu jako jedna linia JSON
+    with open(PLAYLIST_STREAM_FILE, "w", encoding="utf-8") as f:
+        for record in records():
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+
+def playlist_export_file():
+    # Import reads the newest playlist export, so an old file in the other format
+    # (pipelined mode always writes JSONL) is not used. On a tie the configured format wins.
+    files = [PLAYLIST_EXPORT_FILE, PLAYLIST_STREAM_FILE]
+    if STREAM_EXPORT:
+        files.reverse()
+    existing = [f for f in files if os.path.exists(f)]
+    return max(existing, key=os.path.getmtime) if existing else files[0]
+
+def export_exists(filename):
+    # filename: one of the txt files or the playlist export, looked up in the archive when used
+    if archive is not None:
+        return has_rows(archive, ARCHIVE_TABLES.get(filename, "playlists"))
+    return os.path.exists(filename)
+
+def read_export_ids(filename):
+    if archive is not None:
+        return [item_id for item_id, meta in iter_items(archive, ARCHIVE_TABLES[filename])]
+    return read_id_file(filename)
+
+def iter_playlist_records():
+    if archive is not None:
+        return iter_playlists(archive)
+    return iter_playlist_export(playlist_export_file())
+
+# ─────────────────────────────────────────────
+# INCREMENTAL EXPORT (user_date_added watermark)
+# ─────────────────────────────────────────────
+class IdHash:
+    # Order-independent hash of the exported IDs (sum of per-ID SHA-1 values),
+    # built one ID at a time so a streamed export doesn't keep them in memory
+    def __init__(self, ids=()):
+        self.count = 0
+        self.value = 0
+        for item_id in ids:
+            self.add(item_id)
+
+    def add(self, item_id):
+        digest = hashlib.sha1(item_id.encode("utf-8")).digest()
+        self.value = (self.value + int.from_bytes(digest, "big")) % 2**160
+        self.count += 1
+
+    def hexdigest(self):
+        return f"{self.value:040x}"
+
+def load_watermarks():
+    if not os.path.exists(WATERMARK_FILE):
+        return {}
+    try:
+        with open(WATERMARK_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_watermark(filename, newest, ids):
+    # ids: IdHash of everything in the file
+    marks = load_watermarks()
+    marks[filename] = {"newest": newest.isoformat() if newest else None,
+                       "count": ids.count, "hash": ids.hexdigest()}
+    tmp = WATERMARK_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(marks, f, indent=4)
+    os.replace(tmp, WATERMARK_FILE)
+
+def read_export_lines(filename):
+    # ID -> cała linia, w kolejności z pliku
+    lines = {}
+    with open(filename, "r", encoding="utf-8") as f:
+        for line in f:
+            if SEPARATOR in line:
+                lines[line.split(SEPARATOR, 1)[0].strip()] = line
+    return lines
+
+def export_incremental(filename, fetch_fn, count_fn, label, describe, order, mark):
+    # Returns False when a full export is needed
+    if not mark.get("newest") or not os.path.exists(filename):
+        return False
+    old = read_export_lines(filename)
+    if len(old) != mark.get("count") or IdHash(old).hexdigest() != mark.get("hash"):
+        print(f"  {filename} changed since the last export, downloading all {label}.")
+        return False
+    watermark = datetime.fromisoformat(mark["newest"])
+
+    # Najnowsze najpierw, aż do pierwszego elementu sprzed znacznika
+    fetch_fn = partial(fetch_fn, order=order, order_direction=OrderDirection.Descending)
+    new_items = []
+    offset = 0
+    reached = False
+    while not reached:
+        page = call_with_retry(lambda: fetch_fn(limit=PAGE_SIZE, offset=offset), source_limiter, MAX_RETRIES)
+        for item in page:
+            if not item.user_date_added or item.user_date_added <= watermark:
+                reached = True
+                break
+            new_items.append(item)
+        if len(page) < PAGE_SIZE:
+            break
+        offset += len(page)
+    new_items.reverse()
+
+    # Re-added favorites move to the end, the rest keeps the old order
+    new_ids = [str(item.id) for item in new_items]
+    seen = set(new_ids)
+    kept = [line for item_id, line in old.items() if item_id not in seen]
+    total = len(kept) + len(new_items)
+    server_total = call_with_retry(count_fn, source_limiter, MAX_RETRIES)
+    if server_total != total:
+        # Something was removed on the source, only a full scan can tell what
+        print(f"  Found {server_total} {label}, expected {total}, downloading all {label}.")
+        return False
+
+    tmp = filename + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.writelines(kept)
+        for item in new_items:
+            f.write(f"{item.id}{SEPARATOR}{describe(item)}\n")
+    os.replace(tmp, filename)
+
+    newest = new_items[-1].user_date_added if new_items else watermark
+    save_watermark(filename, newest, IdHash([line.split(SEPARATOR, 1)[0].strip() for line in kept] + new_ids))
+    print(f"  Found {len(new_items)} new {label} since the last export ({total} in total).")
+    return True
+
+def export_favorites(filename, fetch_fn, count_fn, label, describe, order):
+    # The watermark belongs to the txt files, the archive is always exported in full
+    mark = None if full_export or archive is not None else load_watermarks().get(filename)
+    if mark and export_incremental(filename, fetch_fn, count_fn, label, describe, order, mark):
+        return
+    newest, ids = export_simple(filename, fetch_fn, count_fn, label, describe, order)
+    if archive is None:
+        save_watermark(filename, newest, ids)
+
+# ─────────────────────────────────────────────
+# MENU - MODE SELECTION
+# ─────────────────────────────────────────────
+print("\nSelect Mode:")
+print("1 - Full Transfer (Login Source -> Export -> Login destination account -> Import)")
+print("2 - Export Only (Login Source -> Save to files -> Exit)")
+print("3 - Import Only (Skip Source login, use local files)")
+print("4 - Sync (Like Full Transfer, but only adds what the destination account is missing)")
+print("5 - Pipelined Full Transfer (Login both accounts -> Export and Import at the same time)")
+print(f"6 - Retry Failed (Login destination -> Add only what failed last time, from {FAILED_LOG_FILE})")
+
+mode_choice = input("Enter mode (1/2/3/4/5/6): ").strip()
+
+enable_export = mode_choice in ("1", "2", "4", "5")
+enable_import = mode_choice in ("1", "3", "4", "5", "6")
+sync_mode = mode_choice == "4"
+pipeline_mode = mode_choice == "5"
+retry_mode = mode_choice == "6"
+dry_run = "--dry-run" in sys.argv  # Sync: only print the planned changes
+full_export = "--full-export" in sys.argv  # Ignore the watermark and download everything again
+fresh_login = "--login" in sys.argv  # Ignore saved logins and log in again
+
+# ─────────────────────────────────────────────
+# MENU - CONTENT SELECTION
+# ─────────────────────────────────────────────
+print("\nWhat content should be processed?")
+print("1 - Favorite Tracks")
+print("2 - Albums")
+print("3 - Artists")
+print("4 - Playlists")
+print("5 - Everything")
+
+choice = input("Enter number: ").strip()
+
+transfer_tracks = choice in ("1", "5")
+transfer_albums = choice in ("2", "5")
+transfer_artists = choice in ("3", "5")
+transfer_playlists = choice in ("4", "5")
+
+# ─────────────────────────────────────────────
+# RESUME (run with --resume to continue an interrupted run)
+# ─────────────────────────────────────────────
+resume = "--resume" in sys.argv
+journal_state = load_journal(JOURNAL_FILE) if resume else JournalState()
+if resume:
+    print(f"\nResuming from '{JOURNAL_FILE}': finished work will be skipped.")
+journal = Journal(JOURNAL_FILE, append=resume)
+atexit.register(journal.close)
+
+# Categories whose export file was already written by the interrupted run
+export_albums = transfer_albums and "albums" not in journal_state.exported
+export_artists = transfer_artists and "artists" not in journal_state.exported
+export_tracks = transfer_tracks and "tracks" not in journal_state.exported
+export_playlists = transfer_playlists and "playlists" not in journal_state.exported
+
+# ─────────────────────────────────────────────
+# ARCHIVE (optional SQLite export format)
+# ─────────────────────────────────────────────
+archive = None
+if USE_ARCHIVE and pipeline_mode:
+    print("\nThe archive is not used in pipelined mode, the txt/JSON files are written instead.")
+elif USE_ARCHIVE:
+    archive = open_archive(ARCHIVE_FILE)
+    atexit.register(archive.close)
+    print(f"\nUsing archive '{ARCHIVE_FILE}' instead of the txt/JSON files.")
+
+# Podsumowanie wywołań API także przy przerwanym przebiegu
+atexit.register(metrics.finish, "transfer", METRICS_FILE, METRICS_PROM_FILE)
+
+# ─────────────────────────────────────────────
+# LOGIN SOURCE & EXPORT (Conditional)
+# ─────────────────────────────────────────────
+if enable_export and any([export_albums, export_artists, export_tracks, export_playlists]):
+    print('\n=== Login to SOURCE account (Export from) ===')
+    session1, keeper1 = login(SOURCE_PROFILE, fresh_login)
+    atexit.register(keeper1.stop)
+    source = session1.user.favorites
+    source_limiter = RateLimiter(RATE_LIMIT)
+
+# Pipelined mode exports while importing, see PIPELINE below
+if enable_export and any([export_albums, export_artists, export_tracks, export_playlists]) and not pipeline_mode:
+    print('\n--- EXPORTING DATA (Saving IDs and Names) ---')
+
+    # --- 1. ALBUMS ---
+    if export_albums:
+        export_favorites("album_id_list.txt", source.albums, source.get_albums_count, "albums",
+                         describe_album, AlbumOrder.DateAdded)
+        journal.record(sync=True, t="exported", cat="albums")
+
+    # --- 2. ARTISTS ---
+    if export_artists:
+        export_favorites("artist_id_list.txt", source.artists, source.get_artists_count, "artists",
+                         describe_artist, ArtistOrder.DateAdded)
+        journal.record(sync=True, t="exported", cat="artists")
+
+    # --- 3. TRACKS (FAVORITES) ---
+    if export_tracks:
+        export_favorites("track_id_list.txt", source.tracks, source.get_tracks_count, "favorite tracks",
+                         describe_track, ItemOrder.Date)
+        journal.record(sync=True, t="exported", cat="tracks")
+
+    # --- 4. PLAYLISTS (FULL EXPORT) ---
+    if export_playlists and STREAM_EXPORT:
+        print("\n  Fetching and analyzing playlists...")
+        export_playlists_stream(source)
+        journal.record(sync=True, t="exported", cat="playlists")
+
+    elif export_playlists:
+        print("\n  Fetching playlists...")
+        playlists = fetch_all(source.playlists, source.get_playlists_count, "playlists", PAGE_SIZE, FETCH_WORKERS,
+                              limiter=source_limiter)
+        
+        playlists_data = []
+        
+        print("  Analyzing playlist content...")
+        tracks_total = sum(playlist_size(pl) for pl in playlists)
+        for pl, record, error in tqdm(scan_playlists(playlists, tracks_total), total=len(playlists),
+                                      desc="Scanning playlists", position=0):
+            if error is not None:
+                tqdm.write(f"  [WARN] Failed to fetch content for playlist {pl.name}: {error}")
+                continue
+            playlists_data.append(record)
+
+        if archive is not None:
+            write_playlists(archive, playlists_data)
+        else:
+            with open(PLAYLIST_EXPORT_FILE, "w", encoding="utf-8") as f:
+                json.dump(playlists_data, f, ensure_ascii=False, indent=4)
+        journal.record(sync=True, t="exported", cat="playlists")
+
+    print("\nData exported successfully with Metadata.")
+
+# Check if we should stop here (Export Only mode)
+if not enable_import:
+    print("\n--- EXPORT ONLY MODE FINISHED ---")
+    print("Files saved locally with titles/artists. Exiting.")
+    input("Press Enter to exit...")
+    sys.exit()
+
+# Retry Failed: the previous failure log is loaded before it gets overwritten
+retry_records = []
+if retry_mode:
+    retry_records = load_failures(FAILED_LOG_FILE)
+    if not retry_records:
+        print(f"\nNo failures in '{FAILED_LOG_FILE}', nothing to retry.")
+        input("Press Enter to exit...")
+        sys.exit()
+    print(f"\nLoaded {len(retry_records)} failures from '{FAILED_LOG_FILE}'.")
+
+# If we are in Import Only mode, check files
+elif enable_import and not enable_export:
+    print("\n--- SKIPPING EXPORT (Loading from local files) ---")
+    files_to_check = []
+    if transfer_albums: files_to_check.append("album_id_list.txt")
+    if transfer_artists: files_to_check.append("artist_id_list.txt")
+    if transfer_tracks: files_to_check.append("track_id_list.txt")
+    if transfer_playlists: files_to_check.append(playlist_export_file())
+    
+    missing = [f for f in files_to_check if not export_exists(f)]
+    if missing:
+        print(f"[WARNING] The following files are missing: {missing}")
+        input("Press Enter to continue anyway...")
+
+
+# ─────────────────────────────────────────────
+# LOGIN DESTINATION
+# ─────────────────────────────────────────────
+print('\n=== Login to DESTINATION account (Import to) ===')
+session2, keeper2 = login(DEST_PROFILE, fresh_login)
+atexit.register(keeper2.stop)
+dest = session2.user.favorites
+dest_limiter = RateLimiter(RATE_LIMIT)
+
+# Buffered like the journal, one JSON line per failure. Retry Failed writes a
+# new log next to the old one and swaps it in at the end, a crash keeps the old one.
+# --resume appends: failures of work the interrupted run finished are not seen again.
+failure_log_path = FAILED_LOG_FILE + ".tmp" if retry_mode else FAILED_LOG_FILE
+failure_log = Journal(failure_log_path, append=resume and not retry_mode)
+atexit.register(failure_log.close)
+
+# Zamienniki dla ID niedostępnych na koncie docelowym (np. inny region)
+rematcher = None
+if REMATCH:
+    rematcher = Rematcher(session2, MatchCache(MATCH_CACHE_FILE, MATCH_CACHE_DAYS), dest_limiter,
+                          MAX_RETRIES, IMPORT_WORKERS)
+
+
+# ─────────────────────────────────────────────
+# IMPORT FUNCTION (Simple Items with Metadata Parsing)
+# ─────────────────────────────────────────────
+def read_id_file(filename):
+    # Metadane zostają w pliku, log_error czyta je w razie błędu
+    return [item_id for item_id, meta in read_text_rows(filename)]
+
+def read_archive_ids(table):
+    # Strumieniowo z archiwum, z --resume bez elementów już oznaczonych jako dodane
+    for item_id, meta in iter_items(archive, table, pending=resume):
+        yield item_id
+
+def known_replacement(kind, item_id):
+    # Replacement found by an earlier run (re-matching cache), None without one
+    if rematcher is None or kind not in Rematcher.CODES:
+        return None
+    new_id = rematcher.known(kind, item_id)
+    return new_id if new_id != item_id else None
+
+def on_destination(kind, item_id, skip):
+    # Sync: a re-matched item is on the destination under its replacement ID
+    return item_id in skip or known_replacement(kind, item_id) in skip
+
+def add_simple_items(filename, add_fn, label, skip=None):
+    if not export_exists(filename):
+        print(f"File {filename} not found. Skipping {label}.")
+        return
+
+    if archive is not None:
+        table = ARCHIVE_TABLES[filename]
+        done = journal_state.added.get(label, set())
+        ids = (i for i in read_archive_ids(table) if i not in done and not (skip and on_destination(table, i, skip)))
+        import_ids(ids, add_fn, label, filename, count_items(archive, table, pending=resume))
+        return
+
+    ids_to_process = read_id_file(filename)
+
+    # Sync: pomijamy to, co konto docelowe już ma
+    if skip:
+        kind = ARCHIVE_TABLES[filename]
+        ids_to_process = [i for i in ids_to_process if not on_destination(kind, i, skip)]
+
+    # Pomijamy elementy dodane już w przerwanym przebiegu (--resume)
+    done = journal_state.added.get(label, set())
+    if done:
+        before = len(ids_to_process)
+        ids_to_process = [i for i in ids_to_process if i not in done]
+        print(f"\nSkipping {before - len(ids_to_process)} {label} already added by the previous run.")
+
+    import_ids(ids_to_process, add_fn, label, filename)
+
+def import_ids(ids, add_fn, label, filename, total=None):
+    # Statuses are kept in the archive table when the archive is used
+    table = ARCHIVE_TABLES[filename] if archive is not None else None
+    kind = ARCHIVE_TABLES[filename]
+    # Rejected tracks / albums wait for re-matching instead of going to the log right away
+    unmatched = {} if rematcher is not None and kind in Rematcher.CODES else None
+    # Items re-matched by an earlier run are sent as their replacement right away
+    sources = {}
+
+    def translate(item_id):
+        new_id = known_replacement(kind, item_id)
+        if new_id is None:
+            return item_id
+        sources.setdefault(new_id, []).append(item_id)
+        return new_id
+
+    def failed(item_id, e, note=""):
+        # Nazwę czytamy z pliku eksportu tylko dla elementów, które się nie dodały
+        info = (lookup_meta(filename, item_id) or f"ID: {item_id} (No metadata in file)") + note
+        if is_transient(e):
+            info += " [temporary error, retry later]"
+        log_error(info, e, kind, item_id)
+        if table:
+            mark_items(archive, table, [item_id], "failed", str(e))
+
+    def on_error(item_id, e):
+        if item_id in sources:
+            for source_id in sources[item_id]:
+                failed(source_id, e, f" [replacement {item_id} failed]")
+        elif unmatched is not None and not is_transient(e):
+            unmatched[item_id] = e
+        else:
+            failed(item_id, e)
+
+    def on_success(item_id):
+        for source_id in sources.get(item_id, [item_id]):
+            journal.record(t="add", cat=label, id=source_id)
+            if table:
+                mark_items(archive, table, [source_id], "added")
+
+    print(f"\nAdding {label}...")
+    report = run_bulk(map(translate, ids), add_fn, label, IMPORT_WORKERS, dest_limiter, MAX_RETRIES,
+                      ordered=KEEP_ORDER, window=ORDER_WINDOW, on_error=on_error, batch_size=BATCH_SIZE,
+                      on_success=on_success, total=total)
+    replaced = rematch_ids(unmatched, add_fn, label, filename, failed) if unmatched else 0
+    if table:
+        archive.commit()
+    processed = len(report.added) + len(report.failed) + len(report.transient)
+    print(f"Added {len(report.added) + replaced}/{processed} {label} "
+          f"({len(report.failed) - replaced} failed, {len(report.transient)} temporary failures).")
+
+def rematch_ids(unmatched, add_fn, label, filename, failed):
+    # unmatched: {id: error} rejected by the destination. Replacements found by
+    # ISRC / UPC or search are added at the end, the rest goes to the failure log.
+    kind = ARCHIVE_TABLES[filename]
+    table = kind if archive is not None else None
+    print(f"Looking for replacements of {len(unmatched)} unavailable {label}...")
+    matches = rematcher.match(kind, [(item_id, *meta_codes(lookup_meta(filename, item_id))) for item_id in unmatched])
+    sources = {}
+    for item_id, new_id in matches.items():
+        sources.setdefault(new_id, []).append(item_id)
+
+    replaced = []
+
+    def on_success(new_id):
+        for item_id in sources[new_id]:
+            del unmatched[item_id]
+            replaced.append(item_id)
+            journal.record(t="add", cat=label, id=item_id)
+            if table:
+                mark_items(archive, table, [item_id], "added", f"replaced by {new_id}")
+
+    def on_error(new_id, e):
+        # The replacement was found but the destination did not take it either
+        for item_id in sources[new_id]:
+            del unmatched[item_id]
+            failed(item_id, e, f" [replacement {new_id} failed]")
+
+    total = len(unmatched)
+    if sources:
+        run_bulk(list(sources), add_fn, label, IMPORT_WORKERS, dest_limiter, MAX_RETRIES,
+                 batch_size=BATCH_SIZE, on_success=on_success, on_error=on_error, desc="Adding re-matched")
+    for item_id, e in unmatched.items():
+        failed(item_id, e, " [no replacement found]")
+    print(f"Re-matched {len(replaced)}/{total} unavailable {label}.")
+    return len(replaced)
+
+
+# ─────────────────────────────────────────────
+# PLAYLIST HELPERS (Sync map & fingerprints)
+# ─────────────────────────────────────────────
+def playlist_track_ids(pl_data):
+    return [t['id'] if isinstance(t, dict) else t for t in pl_data.get('tracks', [])]
+
+def playlist_fingerprint(pl_data):
+    content = [pl_data['name'], pl_data.get('description') or '', playlist_track_ids(pl_data)]
+    return hashlib.sha1(json.dumps(content).encode("utf-8")).hexdigest()
+
+def load_sync_map():
+    if not os.path.exists(PLAYLIST_SYNC_FILE):
+        return {}
+    with open(PLAYLIST_SYNC_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_sync_map(sync_map):
+    tmp = PLAYLIST_SYNC_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(sync_map, f, indent=4)
+    os.replace(tmp, PLAYLIST_SYNC_FILE)
+
+def open_dest_playlist(pl_id):
+    # None only when the playlist is gone from the destination. Other errors
+    # (429, server errors after all retries) are raised, so the caller doesn't
+    # create a second copy of a playlist that still exists.
+    try:
+        return call_with_retry(lambda: session2.playlist(pl_id), dest_limiter, MAX_RETRIES)
+    except ObjectNotFound:
+        return None
+
+def read_playlist_ids(pl):
+    ids = []
+    offset = 0
+    while True:
+        batch = call_with_retry(lambda: pl.items(limit=100, offset=offset), dest_limiter, MAX_RETRIES)
+        if not batch: break
+        ids.extend(str(item.id) for item in batch)
+        offset += len(batch)
+    return ids
+
+sync_map = load_sync_map()
+dest_user = str(session2.user.id)
+
+def synced_playlist(key):
+    # Destination playlist made for this source playlist by an earlier run,
+    # in every import mode so running it again doesn't copy playlists twice.
+    # Entries of another destination account (older ones have no user) are ignored.
+    synced = sync_map.get(key)
+    if synced and synced.get("user", dest_user) != dest_user:
+        return None
+    return synced
+
+def rematch_playlist(pl, raw_tracks, failures):
+    # Runs in the playlist worker. Rejected tracks are looked up by ISRC /
+    # search and the replacements inserted where the originals would be.
+    # Returns the failures that are left.
+    lost = {tid for tid, error in failures if not is_transient(error)}
+    if not lost:
+        return failures
+    tracks = {t['id']: t for t in raw_tracks if isinstance(t, dict) and t['id'] in lost}
+    matches = rematcher.match("tracks", [(tid, *playlist_track_codes(tracks.get(tid))) for tid in lost])
+    if not matches:
+        return failures
+
+    inserts = []
+    skipped = 0  # Lost tracks without a replacement before this position
+    for index, tid in enumerate(playlist_track_ids({'tracks': raw_tracks})):
+        if tid not in lost:
+            continue
+        if tid not in matches:
+            skipped += 1
+            continue
+        position = index - skipped
+        if inserts and inserts[-1][0] + len(inserts[-1][1]) == position:
+            inserts[-1][1].append(matches[tid])
+        else:
+            inserts.append((position, [matches[tid]]))
+    rejected = {new_id for new_id, _ in apply_playlist_diff(pl, [], inserts, dest_limiter, MAX_RETRIES, PLAYLIST_CHUNK)}
+    left = [(tid, error) for tid, error in failures if tid not in matches or matches[tid] in rejected]
+    if len(left) < len(failures):
+        tqdm.write(f"  Re-matched {len(failures) - len(left)} unavailable tracks in '{pl.name}'.")
+    return left
+
+# ─────────────────────────────────────────────
+# IMPORT FUNCTION (Playlists with Metadata Parsing)
+# ─────────────────────────────────────────────
+def import_playlists_cloned(playlists=None, path=None):
+    # playlists: records to import, read from the export file when not given
+    # (path, or the newest playlist export)
+    if playlists is None:
+        path = path or playlist_export_file()
+        export_file = ARCHIVE_FILE if archive is not None else path
+        if not export_exists(path):
+            print(f"File {export_file} not found. Skipping playlists.")
+            return
+        print(f"\nCloning playlists from {export_file}...")
+        playlists = iter_playlist_records() if archive is not None else iter_playlist_export(path)
+    else:
+        print("\nCloning playlists...")
+
+    def populate(new_pl, key, track_ids, start_offset):
+        # Runs in a worker thread, chunks of one playlist are added in order.
+        # Tidal skips unavailable tracks, they are read from the response.
+        # A chunk rejected as a whole is bisected to find the bad tracks.
+        failures = []
+        present = set(track_ids[:start_offset])  # Tidal skips these as duplicates
+
+        def add(batch):
+            failures.extend(add_to_playlist(new_pl, batch, present=present)[1])
+            present.update(batch)
+
+        for start in range(start_offset, len(track_ids), PLAYLIST_CHUNK):
+            chunk = track_ids[start:start + PLAYLIST_CHUNK]
+            for tid, error in send_batch(chunk, add, dest_limiter, MAX_RETRIES):
+                if error is not None:
+                    failures.append((tid, error))
+            journal.record(t="offset", key=key, offset=start + len(chunk))
+        return failures, None
+
+    def update(dest_pl, pl_name, pl_desc, track_ids):
+        # Sync: only the difference between the destination playlist and the export is sent
+        if dest_pl.name != pl_name or (dest_pl.description or '') != (pl_desc or ''):
+            call_with_retry(lambda: dest_pl.edit(pl_name, pl_desc), dest_limiter, MAX_RETRIES)
+        existing_ids = read_playlist_ids(dest_pl)
+        removes, inserts = playlist_diff(existing_ids, track_ids)
+        moves = count_moves(existing_ids, removes, inserts)
+        failures = apply_playlist_diff(dest_pl, removes, inserts, dest_limiter, MAX_RETRIES, PLAYLIST_CHUNK)
+        added = sum(len(ids) for _, ids in inserts) - moves - len(failures)
+        return failures, (added, len(removes) - moves, moves)
+
+    def with_meta(raw_tracks, sources, fn, *args):
+        # Runs fn in the worker, metadata and position are picked only for the tracks that failed.
+        # sources: cached replacement -> [source IDs] of the tracks sent as their replacement
+        failures, ops = fn(*args)
+        # A rejected replacement is reported under its source track (so Retry Failed puts it
+        # back at its position) and not looked up again
+        replaced = []
+        notes = {}
+        for tid, error in failures:
+            if tid in sources:
+                source_id = sources[tid].pop(0) if len(sources[tid]) > 1 else sources[tid][0]
+                replaced.append((source_id, error))
+                notes[source_id] = f" [replacement {tid} failed]"
+        failures = [(tid, error) for tid, error in failures if tid not in sources]
+        if rematcher is not None:
+            failures = rematch_playlist(args[0], raw_tracks, failures)
+        failures += replaced
+        failed = {tid for tid, _ in failures}
+        metas = {t['id']: t.get('meta') for t in raw_tracks if isinstance(t, dict) and t['id'] in failed}
+        for tid, note in notes.items():
+            metas[tid] = (metas.get(tid) or f"ID: {tid}") + note
+        positions = {tid: i for i, tid in enumerate(playlist_track_ids({'tracks': raw_tracks})) if tid in failed}
+        return [(tid, metas.get(tid), positions.get(tid), error) for tid, error in failures], ops
+
+    def finished(key, pl_id, fingerprint):
+        sync_map[key] = {"id": pl_id, "hash": fingerprint, "user": dest_user}
+        save_sync_map(sync_map)
+        if archive is not None:
+            mark_playlist(archive, key, "added", pl_id)
+            archive.commit()
+
+    def collect(future):
+        nonlocal totals
+        key, pl_id, fingerprint, pl_name = pending.pop(future)
+        try:
+            failures, ops = future.result()
+        except Exception as e:
+            tqdm.write(f"  [CRITICAL] Failed to update playlist '{pl_name}'")
+            log_error(f"Entire Playlist: {pl_name}", e, "playlists", key, playlist=pl_name, dest_playlist=pl_id)
+            return
+        for tid, meta, position, error in failures:
+            info = f"Track: {meta} (in PL '{pl_name}')" if meta else f"Track ID: {tid} in playlist '{pl_name}'"
+            log_error(info, error, "playlist_tracks", tid, playlist=pl_name, playlist_key=key,
+                      dest_playlist=pl_id, position=position)
+        if ops:
+            totals = [a + b for a, b in zip(totals, ops)]
+        # Tracks that failed are unavailable, they don't make the playlist "changed" next time
+        finished(key, pl_id, fingerprint)
+
+    def submit(fn, raw_tracks, sources, *args, info):
+        # Only a few playlists wait for a worker, the rest of the export is
+        # read when there is room (their track lists stay out of memory)
+        pending[pool.submit(with_meta, raw_tracks, sources, fn, *args)] = info
+        if len(pending) >= PLAYLIST_WORKERS * 2:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                collect(future)
+
+    created = updated = unchanged = 0
+    totals = [0, 0, 0]  # added, removed, moved
+    pending = {}
+    tracks_sent = 0  # Tracks handed to the workers, for the throughput summary
+    started = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=PLAYLIST_WORKERS) as pool:
+        # Playlists are created one by one so they keep their order on the account
+        for index, pl_data in enumerate(tqdm(playlists, desc="Creating playlists")):
+            pl_name = pl_data['name']
+            pl_desc = pl_data.get('description', '')
+            raw_tracks = pl_data.get('tracks', []) # To jest teraz lista słowników lub stringów
+            key = playlist_key(index, pl_data)
+            fingerprint = playlist_fingerprint(pl_data)
+
+            synced = synced_playlist(key)
+            if synced and synced["hash"] == fingerprint:
+                # Nothing changed in the source playlist since the last transfer
+                unchanged += 1
+                continue
+
+            # Nowy format JSON: {"id": "...", "meta": "..."}, stary: "12345" (string)
+            track_ids_only = playlist_track_ids(pl_data)
+            sources = {}
+            if rematcher is not None:
+                # Replacements found by earlier runs are sent right away
+                for i, tid in enumerate(track_ids_only):
+                    new_id = rematcher.known("tracks", tid)
+                    if new_id and new_id != tid:
+                        sources.setdefault(new_id, []).append(tid)
+                        track_ids_only[i] = new_id
+
+            if synced:
+                try:
+                    dest_pl = open_dest_playlist(synced["id"])
+                except Exception as e:
+                    tqdm.write(f"  [CRITICAL] Failed to open playlist '{pl_name}'")
+                    log_error(f"Entire Playlist: {pl_name}", e, "playlists", key, playlist=pl_name,
+                              dest_playlist=synced["id"])
+                    continue
+                if dest_pl is None:
+                    tqdm.write(f"  Playlist '{pl_name}' from an earlier transfer is gone from the destination, creating it again.")
+                else:
+                    submit(update, raw_tracks, sources, dest_pl, pl_name, pl_desc, track_ids_only,
+                           info=(key, synced["id"], fingerprint, pl_name))
+                    updated += 1
+                    tracks_sent += len(track_ids_only)
+                    continue
+
+            new_pl = None
+            start_offset = 0
+            previous = journal_state.playlists.get(key)
+            if previous:
+                # Playlist created by the interrupted run, continue filling it
+                if previous["offset"] >= len(raw_tracks):
+                    finished(key, previous["id"], fingerprint)
+                    continue
+                try:
+                    new_pl = open_dest_playlist(previous["id"])
+                except Exception as e:
+                    tqdm.write(f"  [CRITICAL] Failed to open playlist '{pl_name}'")
+                    log_error(f"Entire Playlist: {pl_name}", e, "playlists", key, playlist=pl_name,
+                              dest_playlist=previous["id"])
+                    continue
+                if new_pl is None:
+                    tqdm.write(f"  Playlist '{pl_name}' from the previous run is gone, creating it again.")
+                else:
+                    start_offset = previous["offset"]
+
+            if new_pl is None:
+                try:
+                    dest_limiter.acquire()
+                    new_pl = session2.user.create_playlist(pl_name, pl_desc)
+                    journal.record(sync=True, t="playlist", key=key, id=str(new_pl.id))
+                    created += 1
+                except Exception as e:
+                    tqdm.write(f"  [CRITICAL] Failed to create playlist '{pl_name}'")
+                    log_error(f"Entire Playlist: {pl_name}", e, "playlists", key, playlist=pl_name)
+                    continue
+
+            if not track_ids_only:
+                finished(key, str(new_pl.id), fingerprint)
+                continue
+
+            submit(populate, raw_tracks, sources, new_pl, key, track_ids_only, start_offset,
+                   info=(key, str(new_pl.id), fingerprint, pl_name))
+            tracks_sent += len(track_ids_only) - start_offset
+
+        for future in tqdm(as_completed(list(pending)), total=len(pending), desc="Filling playlists"):
+            collect(future)
+    metrics.record_phase("Cloning playlists", tracks_sent, started)
+
+    print(f"Playlists: {created} created, {updated} updated, {unchanged} unchanged.")
+    if updated:
+        print(f"  Updates: {totals[0]} tracks added, {totals[1]} removed, {totals[2]} moved.")
+
+# ─────────────────────────────────────────────
+# SYNC (Differential - compare with destination library)
+# ─────────────────────────────────────────────
+def fetch_existing_ids(fetch_fn, count_fn, label):
+    items = fetch_all(fetch_fn, count_fn, label, PAGE_SIZE, FETCH_WORKERS, "Reading", dest_limiter)
+    return {str(item.id) for item in items}
+
+existing = {}
+if sync_mode:
+    print("\n--- SYNC: Reading destination library ---")
+    sync_sources = [
+        (transfer_albums, "albums", "album_id_list.txt", dest.albums, dest.get_albums_count),
+        (transfer_artists, "artists", "artist_id_list.txt", dest.artists, dest.get_artists_count),
+        (transfer_tracks, "favorite tracks", "track_id_list.txt", dest.tracks, dest.get_tracks_count),
+    ]
+    plan = []
+    for enabled, label, filename, fetch_fn, count_fn in sync_sources:
+        if not enabled or not export_exists(filename):
+            continue
+        existing[label] = fetch_existing_ids(fetch_fn, count_fn, f"{label} on destination")
+        exported = set(read_export_ids(filename))
+        kind = ARCHIVE_TABLES[filename]
+        missing = {i for i in exported if not on_destination(kind, i, existing[label])}
+        plan.append((label, len(exported), len(exported) - len(missing), len(missing)))
+
+    print("\nPlanned changes:")
+    for label, total, present, missing in plan:
+        print(f"  {label}: {total} in export, {present} already on destination, {missing} to add")
+    if transfer_playlists and export_exists(playlist_export_file()):
+        counts = {"new": 0, "changed": 0, "unchanged": 0}
+        for index, pl_data in enumerate(iter_playlist_records()):
+            synced = synced_playlist(playlist_key(index, pl_data))
+            if not synced:
+                counts["new"] += 1
+            elif synced["hash"] == playlist_fingerprint(pl_data):
+                counts["unchanged"] += 1
+            else:
+                counts["changed"] += 1
+        print(f"  playlists: {counts['new']} to create, {counts['changed']} to update, "
+              f"{counts['unchanged']} unchanged")
+
+    if dry_run:
+        print("\n--- DRY RUN: nothing was changed ---")
+        input("Press Enter to exit...")
+        sys.exit()
+    if input("Continue? (y/n): ").strip().lower() != "y":
+        print("Aborted.")
+        sys.exit()
+
+# ─────────────────────────────────────────────
+# PIPELINE (Export and import at the same time)
+# ─────────────────────────────────────────────
+def iter_queue(q):
+    while True:
+        item = q.get()
+        if item is None:
+            return
+        yield item
+
+def start_producer(produce):
+    # Export runs in its own thread and fills a bounded queue that the import
+    # drains, so export waits when import falls behind instead of using memory
+    q = queue.Queue(maxsize=PIPELINE_QUEUE)
+    def run():
+        try:
+            produce(q.put)
+        except Exception as e:
+            tqdm.write(f"  [ERROR] Export stopped: {e}")
+        finally:
+            q.put(None)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return q, thread
+
+def pipeline_simple(filename, fetch_fn, count_fn, label, describe, order, add_fn, cat):
+    def produce(put):
+        def on_item(item_id, meta):
+            put(item_id)
+        newest, ids = export_simple(filename, fetch_fn, count_fn, label, describe, order, stream=True, on_item=on_item)
+        save_watermark(filename, newest, ids)
+        journal.record(sync=True, t="exported", cat=cat)
+
+    q, thread = start_producer(produce)
+    done = journal_state.added.get(label, set())
+    import_ids((i for i in iter_queue(q) if i not in done), add_fn, label, filename)
+    thread.join()
+
+def pipeline_playlists():
+    def produce(put):
+        export_playlists_stream(source, on_record=put)
+        journal.record(sync=True, t="exported", cat="playlists")
+
+    q, thread = start_producer(produce)
+    import_playlists_cloned(iter_queue(q))
+    thread.join()
+
+# ─────────────────────────────────────────────
+# RETRY FAILED (replay failed_items.jsonl)
+# ─────────────────────────────────────────────
+def retry_playlist_tracks(records):
+    # Failed tracks of one destination playlist, inserted at their original
+    # positions. Runs of neighbouring positions go in one request.
+    first = records[0]
+    try:
+        dest_limiter.acquire()
+        pl = session2.playlist(first["dest_playlist"])
+    except Exception as e:
+        for r in records:
+            log_error(r["info"], e, "playlist_tracks", r["id"], playlist=r.get("playlist"),
+                      playlist_key=r.get("playlist_key"), dest_playlist=r["dest_playlist"], position=r.get("position"))
+        return 0
+    records = sorted(records, key=lambda r: r.get("position") or 0)
+    inserts = []
+    for r in records:
+        position = r.get("position")
+        if position is None:
+            position = pl.num_tracks + sum(len(ids) for _, ids in inserts)
+        if inserts and inserts[-1][0] + len(inserts[-1][1]) == position:
+            inserts[-1][1].append(r["id"])
+        else:
+            inserts.append((position, [r["id"]]))
+    failures = dict(apply_playlist_diff(pl, [], inserts, dest_limiter, MAX_RETRIES, PLAYLIST_CHUNK))
+    for r in records:
+        if r["id"] in failures:
+            log_error(r["info"], failures[r["id"]], "playlist_tracks", r["id"], playlist=r.get("playlist"),
+                      playlist_key=r.get("playlist_key"), dest_playlist=r["dest_playlist"], position=r.get("position"))
+    return len(records) - len(failures)
+
+def retry_failed(records):
+    targets = {
+        "albums": (transfer_albums, "album_id_list.txt", dest.add_album, "albums"),
+        "artists": (transfer_artists, "artist_id_list.txt", dest.add_artist, "artists"),
+        "tracks": (transfer_tracks, "track_id_list.txt", dest.add_track, "favorite tracks"),
+    }
+    by_category = {}
+    for r in records:
+        by_category.setdefault(r["category"], []).append(r)
+
+    # Kategorie spoza wybranej zawartości zostają w logu na następny raz
+    enabled = {cat for cat, target in targets.items() if target[0]}
+    if transfer_playlists:
+        enabled |= {"playlists", "playlist_tracks"}
+    for cat, recs in by_category.items():
+        if cat not in enabled:
+            for r in recs:
+                failure_log.record(**r)
+
+    for cat in ("albums", "artists"):
+        if cat in enabled and cat in by_category:
+            _, filename, add_fn, label = targets[cat]
+            import_ids([r["id"] for r in by_category[cat]], add_fn, label, filename)
+
+    if "playlists" in enabled and "playlists" in by_category:
+        # Whole playlists are imported again from the export, a playlist that was
+        # created before it failed is updated in place instead of created twice
+        failed = {r["id"]: r for r in by_category["playlists"]}
+        for key, r in failed.items():
+            if r.get("dest_playlist") and key not in sync_map:
+                sync_map[key] = {"id": r["dest_playlist"], "hash": "", "user": dest_user}
+        if export_exists(playlist_export_file()):
+            import_playlists_cloned(pl_data for index, pl_data in enumerate(iter_playlist_records())
+                                    if playlist_key(index, pl_data) in failed)
+        else:
+            print("Playlist export not found, failed playlists stay in the log.")
+            for r in failed.values():
+                failure_log.record(**r)
+
+    if "playlist_tracks" in enabled and "playlist_tracks" in by_category:
+        print("\nAdding failed playlist tracks...")
+        per_playlist = {}
+        for r in by_category["playlist_tracks"]:
+            per_playlist.setdefault(r["dest_playlist"], []).append(r)
+        added = sum(retry_playlist_tracks(recs) for recs in per_playlist.values())
+        print(f"Added {added}/{len(by_category['playlist_tracks'])} playlist tracks.")
+
+    if "tracks" in enabled and "tracks" in by_category:
+        _, filename, add_fn, label = targets["tracks"]
+        import_ids([r["id"] for r in by_category["tracks"]], add_fn, label, filename)
+
+# ─────────────────────────────────────────────
+# RUN IMPORT
+# ─────────────────────────────────────────────
+
+if retry_mode:
+    print("\n--- RETRY FAILED ---")
+    retry_failed(retry_records)
+
+elif pipeline_mode:
+    # Categories already exported by an interrupted run (--resume) come from the files
+    print("\n--- PIPELINED TRANSFER (Export and Import at the same time) ---")
+    if transfer_albums and export_albums:
+        pipeline_simple("album_id_list.txt", source.albums, source.get_albums_count, "albums",
+                        describe_album, AlbumOrder.DateAdded, dest.add_album, "albums")
+    elif transfer_albums:
+        add_simple_items("album_id_list.txt", dest.add_album, "albums")
+
+    if transfer_artists and export_artists:
+        pipeline_simple("artist_id_list.txt", source.artists, source.get_artists_count, "artists",
+                        describe_artist, ArtistOrder.DateAdded, dest.add_artist, "artists")
+    elif transfer_artists:
+        add_simple_items("artist_id_list.txt", dest.add_artist, "artists")
+
+    if transfer_playlists and export_playlists:
+        pipeline_playlists()
+    elif transfer_playlists:
+        # Exported by the interrupted pipelined run, which always writes JSONL
+        import_playlists_cloned(path=PLAYLIST_STREAM_FILE)
+
+    if transfer_tracks and export_tracks:
+        pipeline_simple("track_id_list.txt", source.tracks, source.get_tracks_count, "favorite tracks",
+                        describe_track, ItemOrder.Date, dest.add_track, "tracks")
+    elif transfer_tracks:
+        add_simple_items("track_id_list.txt", dest.add_track, "favorite tracks")
+
+else:
+    if transfer_albums:
+        add_simple_items("album_id_list.txt", dest.add_album, "albums", existing.get("albums"))
+
+    if transfer_artists:
+        add_simple_items("artist_id_list.txt", dest.add_artist, "artists", existing.get("artists"))
+
+    if transfer_playlists:
+        import_playlists_cloned()
+
+    if transfer_tracks:
+        add_simple_items("track_id_list.txt", dest.add_track, "favorite tracks", existing.get("favorite tracks"))
+
+journal.close()
+failure_log.close()
+if retry_mode:
+    os.replace(failure_log_path, FAILED_LOG_FILE)
+metrics.finish("transfer", METRICS_FILE, METRICS_PROM_FILE)
+
+print("\nProcess Completed!")
+print(f"Check '{FAILED_LOG_FILE}' for any failed items, run mode 6 to retry them.")
 input("Press Enter to exit...")
\ No newline at end of file
@@ -0,0 +1,371 @@
+from datetime import datetime, timedelta
+from itertools import islice
+from tidalapi.exceptions import ObjectNotFound, TooManyRequests
+import random
+import threading
+import time
+import uuid
+import requests
+import tidalapi
+
+# ─────────────────────────────────────────────
+# SIMULATED TIDAL BACKEND (no network)
+# ─────────────────────────────────────────────
+# Stand-in for the tidalapi Session / User / Favorites / Playlist objects the
+# scripts use. Every call counts as one request and sleeps for the configured
+# latency. Write calls can also be answered with 429 (rate limit) or a random
+# 500, with fail_reads=True page fetches and lookups as well (the scripts retry
+# both).
+
+class Backend:
+    def __init__(self, latency=0.005, jitter=0.5, rate_limit=0, retry_after=1,
+                 error_rate=0.0, unavailable_rate=0.0, max_page=100, fail_reads=False, seed=1):
+        self.latency = latency            # Seconds per request
+        self.jitter = jitter              # +- fraction of latency
+        self.rate_limit = rate_limit      # Requests per second before 429, 0 = unlimited
+        self.retry_after = retry_after    # Seconds sent with a 429
+        self.error_rate = error_rate      # Share of requests failing with 500
+        self.unavailable_rate = unavailable_rate  # Share of IDs that can never be added
+        self.max_page = max_page          # Server side cap on limit=
+        self.fail_reads = fail_reads      # 429 / 500 also for reads, not only writes
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.accounts = []                # Accounts handed out by the next Session() calls
+        self.playlists = {}               # All playlists by ID, for session.playlist()
+        self.reset_counters()
+        self.tokens = float(rate_limit)
+        self.updated = time.monotonic()
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests = {}
+            self.throttled = 0
+            self.errors = 0
+
+    @property
+    def total_requests(self):
+        return sum(self.requests.values())
+
+    def call(self, endpoint, write=False):
+        # One simulated round trip
+        failing = False
+        faulty = write or self.fail_reads
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            if faulty and self.rate_limit:
+                now = time.monotonic()
+                self.tokens = min(self.rate_limit, self.tokens + (now - self.updated) * self.rate_limit)
+                self.updated = now
+                if self.tokens < 1:
+                    self.throttled += 1
+                    raise TooManyRequests(retry_after=self.retry_after)
+                self.tokens -= 1
+            if faulty and self.error_rate and self.random.random() < self.error_rate:
+                failing = True
+                self.errors += 1
+        if self.latency:
+            time.sleep(self.latency * (1 + self.jitter * (2 * random.random() - 1)))
+        if failing:
+            response = requests.Response()
+            response.status_code = 500
+            raise requests.HTTPError("500 Server Error (simulated)", response=response)
+
+    def available(self, item_id):
+        # Deterministic per ID, so a bisected batch finds the same bad IDs again
+        if not self.unavailable_rate:
+            return True
+        return random.Random(f"{self.seed}:{item_id}").random() >= self.unavailable_rate
+
+    def replacement(self, item_id):
+        # The same recording under another ID in the destination catalogue,
+        # for most unavailable IDs (re-matching by ISRC / UPC)
+        item_id = int(item_id)
+        if self.available(item_id) or random.Random(f"{self.seed}:r{item_id}").random() < 0.2:
+            return None
+        return item_id + 10**9
+
+    def install(self, *accounts):
+        # Next tidalapi.Session() calls get these accounts, in this order
+        self.accounts = list(accounts)
+        tidalapi.Session = lambda *args, **kwargs: FakeSession(self, self.accounts.pop(0))
+
+# ─────────────────────────────────────────────
+# LIBRARY OBJECTS
+# ─────────────────────────────────────────────
+EPOCH = datetime(2015, 1, 1)
+
+class Named:
+    __slots__ = ("name",)
+    def __init__(self, name):
+        self.name = name
+
+class Creator:
+    __slots__ = ("id", "name")
+    def __init__(self, user_id):
+        self.id = user_id
+        self.name = f"User {user_id}"
+
+class Item:
+    __slots__ = ("id", "name", "artist", "album", "user_date_added", "isrc", "upc")
+    ARTIST = Named("Artist")
+    ALBUM = Named("Album")
+
+    def __init__(self, item_id, added=None):
+        self.id = item_id
+        self.name = f"Item {item_id}"
+        self.artist = Item.ARTIST
+        self.album = Item.ALBUM
+        self.user_date_added = added or EPOCH + timedelta(seconds=int(item_id) % 10**9)
+        self.isrc = f"SIM{int(item_id) % 10**9:09d}"
+        self.upc = f"{int(item_id) % 10**9:012d}"
+
+class Account:
+    def __init__(self, backend, user_id, tracks=0, albums=0, artists=0, playlists=0, playlist_size=0,
+                 followed=0):
+        self.backend = backend
+        self.user_id = user_id
+        base = user_id * 10**7
+        # str(ID) -> item in date-added order, so removing is O(1) at any size
+        self.favorites = {
+            "tracks": {str(base + i): Item(base + i) for i in range(tracks)},
+            "albums": {str(base + 5 * 10**6 + i): Item(base + 5 * 10**6 + i) for i in range(albums)},
+            "artists": {str(base + 6 * 10**6 + i): Item(base + 6 * 10**6 + i) for i in range(artists)},
+            "playlists": {},
+        }
+        track_ids = [base + i for i in range(max(tracks, playlist_size))]
+        for n in range(playlists + followed):
+            start = (n * playlist_size) % max(1, len(track_ids))
+            items = [Item(track_ids[(start + i) % len(track_ids)]) for i in range(playlist_size)]
+            creator = user_id if n < playlists else user_id + 1
+            self.add_playlist(FakePlaylist(backend, f"Playlist {n}", "Simulated", items, creator))
+
+    def add_playlist(self, pl):
+        self.backend.playlists[pl.id] = pl
+        self.favorites["playlists"][pl.id] = pl
+
+class FakePlaylist:
+    def __init__(self, backend, name, description, items, creator_id):
+        self.backend = backend
+        self.id = str(uuid.uuid4())
+        self.name = name
+        self.description = description
+        self.creator = Creator(creator_id)
+        self.tracks = list(items)
+        self.num_videos = 0
+        self.user_date_added = EPOCH
+
+    @property
+    def num_tracks(self):
+        return len(self.tracks)
+
+    def items(self, limit=100, offset=0):
+        self.backend.call("playlist.items")
+        limit = min(limit, self.backend.max_page)
+        return self.tracks[offset:offset + limit]
+
+    def add(self, media_ids, allow_duplicates=False, position=-1, limit=100):
+        # Like the real API (onArtifactNotFound=SKIP): unavailable tracks and,
+        # without allow_duplicates, tracks already in the playlist are left
+        # out silently, the response lists the IDs that were added
+        self.backend.call("playlist.add", write=True)
+        if isinstance(media_ids, (str, int)):
+            media_ids = [media_ids]
+        present = set() if allow_duplicates else {t.id for t in self.tracks}
+        added = []
+        for item_id in map(int, media_ids):
+            if not self.backend.available(item_id) or item_id in present:
+                continue
+            added.append(item_id)
+            if not allow_duplicates:
+                present.add(item_id)
+        if position < 0 or position > len(self.tracks):
+            position = len(self.tracks)
+        self.tracks[position:position] = [Item(i) for i in added]
+        return added
+
+    def remove_by_indices(self, indices):
+        self.backend.call("playlist.remove_by_indices", write=True)
+        for index in sorted(indices, reverse=True):
+            del self.tracks[index]
+        return True
+
+    def edit(self, title=None, description=None):
+        self.backend.call("playlist.edit", write=True)
+        self.name = title or self.name
+        self.description = description or self.description
+        return True
+
+class FakeFavorites:
+    def __init__(self, backend, account):
+        self.backend = backend
+        self.account = account
+        self.base_url = f"users/{account.user_id}/favorites"
+
+    def _page(self, kind, limit, offset, order_direction=None):
+        self.backend.call(f"favorites.{kind}")
+        data = self.account.favorites[kind]
+        limit = min(limit, self.backend.max_page)
+        if order_direction is not None and str(getattr(order_direction, "value", order_direction)) == "DESC":
+            return list(islice(reversed(data.values()), offset, offset + limit))
+        return list(islice(data.values(), offset, offset + limit))
+
+    def tracks(self, limit=50, offset=0, order=None, order_direction=None):
+        return self._page("tracks", limit, offset, order_direction)
+
+    def albums(self, limit=50, offset=0, order=None, order_direction=None):
+        return self._page("albums", limit, offset, order_direction)
+
+    def artists(self, limit=50, offset=0, order=None, order_direction=None):
+        return self._page("artists", limit, offset, order_direction)
+
+    def playlists(self, limit=50, offset=0, order=None, order_direction=None):
+        return self._page("playlists", limit, offset, order_direction)
+
+    def _count(self, kind):
+        self.backend.call(f"favorites.{kind}.count")
+        return len(self.account.favorites[kind])
+
+    def get_tracks_count(self):
+        return self._count("tracks")
+
+    def get_albums_count(self):
+        return self._count("albums")
+
+    def get_artists_count(self):
+        return self._count("artists")
+
+    def get_playlists_count(self):
+        return self._count("playlists")
+
+    def _add(self, kind, ids):
+        self.backend.call(f"favorites.add_{kind}", write=True)
+        if isinstance(ids, (str, int)):
+            ids = [ids]
+        for item_id in ids:
+            if not self.backend.available(item_id):
+                raise ObjectNotFound(f"{kind} {item_id} not available (simulated)")
+        data = self.account.favorites[kind]
+        now = datetime.now()
+        for item_id in ids:
+            data[str(item_id)] = Item(int(item_id), now)
+        return True
+
+    def add_track(self, ids):
+        return self._add("tracks", ids)
+
+    def add_album(self, ids):
+        return self._add("albums", ids)
+
+    def add_artist(self, ids):
+        return self._add("artists", ids)
+
+    def _remove(self, kind, ids):
+        data = self.account.favorites[kind]
+        for item_id in ids:
+            data.pop(str(item_id), None)
+        return True
+
+    def remove_track(self, item_id):
+        self.backend.call("favorites.remove_tracks", write=True)
+        return self._remove("tracks", [item_id])
+
+    def remove_album(self, item_id):
+        self.backend.call("favorites.remove_albums", write=True)
+        return self._remove("albums", [item_id])
+
+    def remove_artist(self, item_id):
+        self.backend.call("favorites.remove_artists", write=True)
+        return self._remove("artists", [item_id])
+
+    def remove_playlist(self, playlist_id):
+        self.backend.call("favorites.remove_playlists", write=True)
+        return self._remove("playlists", [playlist_id])
+
+class FakeUser:
+    def __init__(self, backend, account):
+        self.backend = backend
+        self.account = account
+        self.id = account.user_id
+        self.favorites = FakeFavorites(backend, account)
+
+    def create_playlist(self, title, description):
+        self.backend.call("user.create_playlist", write=True)
+        pl = FakePlaylist(self.backend, title, description, [], self.id)
+        self.account.add_playlist(pl)
+        return pl
+
+class FakeRequest:
+    # session.request.request(), used by the delete script for raw DELETE calls
+    def __init__(self, backend, account):
+        self.backend = backend
+        self.account = account
+
+    def request(self, method, path, params=None, data=None, headers=None, base_url=None):
+        parts = path.strip("/").split("/")
+        if method == "GET" and parts[0] in ("tracks", "albums"):
+            # Catalogue lookup by ISRC / UPC (filter[isrc] / filter[barcodeId], several codes at once)
+            self.backend.call(f"GET {parts[0]}")
+            attribute = "isrc" if parts[0] == "tracks" else "barcodeId"
+            codes = next(iter((params or {}).values()), [])
+            data = []
+            for code in [codes] if isinstance(codes, str) else codes:
+                new_id = self.backend.replacement(int(code[3:] if code.startswith("SIM") else code))
+                if new_id:
+                    data.append({"id": str(new_id), "type": parts[0], "attributes": {attribute: code}})
+            return FakeResponse({"data": data})
+        if method == "DELETE" and parts[0] == "users" and len(parts) == 5:
+            self.backend.call(f"DELETE favorites/{parts[3]}", write=True)
+            FakeFavorites(self.backend, self.account)._remove(parts[3], parts[4].split(","))
+        elif method == "DELETE" and parts[0] == "playlists":
+            self.backend.call("DELETE playlists", write=True)
+            self.backend.playlists.pop(parts[1], None)
+            FakeFavorites(self.backend, self.account)._remove("playlists", [parts[1]])
+        else:
+            self.backend.call(f"{method} {parts[0]}")
+        return requests.Response()
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+        self.ok = True
+
+    def json(self):
+        return self.data
+
+class FakeConfig:
+    openapi_v2_location = "https://openapi.tidal.com/v2/"
+
+class FakeSession:
+    def __init__(self, backend, account):
+        self.backend = backend
+        self.config = FakeConfig()
+        self.user = FakeUser(backend, account)
+        self.request = FakeRequest(backend, account)
+        self.token_type = "Bearer"
+        self.access_token = "simulated"
+        self.refresh_token = "simulated"
+        self.expiry_time = None
+        self.is_pkce = False
+
+    def login_oauth_simple(self, *args, **kwargs):
+        return None
+
+    def load_oauth_session(self, token_type, access_token, refresh_token=None, expiry_time=None, is_pkce=False):
+        return True
+
+    def token_refresh(self, refresh_token):
+        return True
+
+    def check_login(self):
+        return True
+
+    def search(self, query, models=None, limit=50, offset=0):
+        self.backend.call("search")
+        return {"artists": [], "albums": [], "tracks": [], "videos": [], "playlists": [], "top_hit": None}
+
+    def playlist(self, playlist_id):
+        self.backend.call("playlist")
+        if playlist_id not in self.backend.playlists:
+            raise ObjectNotFound(f"Playlist {playlist_id} not found (simulated)")
+        return self.backend.playlists[playlist_id]
@@ -0,0 +1,198 @@
+import argparse
+import atexit
+import builtins
+import contextlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_tidal import Backend, Account, FakeFavorites, FakePlaylist
+import tidal_utils
+
+TRANSFER = os.path.join(ROOT, "Transfer_library_selectable.py")
+DELETE = os.path.join(ROOT, "Delete_library_selectable.py")
+SCENARIOS = ["fetch_all", "export", "add_simple_items", "import_playlists_cloned",
+             "remove_items", "process_playlists"]
+
+# ─────────────────────────────────────────────
+# RUNNING THE SCRIPTS
+# ─────────────────────────────────────────────
+def run_script(path, answers, overrides):
+    # Runs a script like 'python script.py' would, answering its input() prompts.
+    # overrides: CONFIGURATION constants replaced in the source, e.g. {"IMPORT_WORKERS": "8"}
+    with open(path, "r", encoding="utf-8") as f:
+        source = f.read()
+    for name, value in overrides.items():
+        source = re.sub(rf"^{name}\s*=\s*[^#\n]*", f"{name} = {value} ", source, flags=re.M)
+    code = compile(source, path, "exec")
+
+    answers = iter(answers)
+    exit_funcs = []
+    old_input, old_argv, old_register = builtins.input, sys.argv, atexit.register
+    builtins.input = lambda prompt="": next(answers, "")
+    sys.argv = [path]
+    # Journal, failure log and token keeper are closed when the script ends,
+    # not when the harness exits, while we are still in the work dir
+    atexit.register = lambda fn, *a, **kw: exit_funcs.append((fn, a, kw)) or fn
+    try:
+        exec(code, {"__name__": "__main__", "__file__": path})
+    except SystemExit:
+        pass
+    finally:
+        builtins.input, sys.argv, atexit.register = old_input, old_argv, old_register
+        for fn, a, kw in reversed(exit_funcs):
+            fn(*a, **kw)
+
+def measure(backend, name, items, fn, memory=True, verbose=False):
+    backend.reset_counters()
+    tidal_utils.metrics.reset()  # The scripts' own API summary, per scenario
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull:
+        out = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(devnull)
+        err = contextlib.nullcontext() if verbose else contextlib.redirect_stderr(devnull)
+        with out, err:
+            fn()
+    wall = time.perf_counter() - start
+    peak = 0
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {
+        "scenario": name,
+        "items": items,
+        "requests": backend.total_requests,
+        "throttled": backend.throttled,
+        "errors": backend.errors,
+        "wall_s": round(wall, 3),
+        "items_per_s": round(items / wall, 1) if wall else None,
+        "peak_mb": round(peak / 2**20, 2) if memory else None,
+        "endpoints": dict(sorted(backend.requests.items())),
+    }
+
+# ─────────────────────────────────────────────
+# SCENARIOS
+# ─────────────────────────────────────────────
+def run_size(size, args, overrides):
+    backend = Backend(latency=args.latency, rate_limit=args.rate_limit, retry_after=args.retry_after,
+                      error_rate=args.error_rate, unavailable_rate=args.unavailable_rate,
+                      max_page=args.max_page, fail_reads=args.fail_reads, seed=args.seed)
+    source = Account(backend, 1, tracks=size, albums=size // 10, artists=size // 20,
+                     playlists=args.playlists, playlist_size=args.playlist_size)
+    dest = Account(backend, 2)
+    favorites = size + size // 10 + size // 20
+    playlist_tracks = args.playlists * args.playlist_size
+    page_size = int(overrides.get("PAGE_SIZE", tidal_utils.PAGE_SIZE))
+    fetch_workers = int(overrides.get("FETCH_WORKERS", tidal_utils.FETCH_WORKERS))
+    only = set(args.only.split(",")) if args.only else set(SCENARIOS)
+    results = []
+
+    def scenario(name, items, fn):
+        if name in only:
+            result = measure(backend, name, items, fn, not args.no_memory, args.verbose)
+            result["size"] = size
+            results.append(result)
+
+    def fetch():
+        fav = FakeFavorites(backend, source)
+        tidal_utils.fetch_all(fav.tracks, fav.get_tracks_count, "tracks", page_size, fetch_workers)
+
+    def export():
+        backend.install(source)
+        run_script(TRANSFER, ["2", "5"], overrides)
+
+    def import_tracks():
+        backend.install(dest)
+        run_script(TRANSFER, ["3", "1"], overrides)
+
+    def import_playlists():
+        backend.install(dest)
+        run_script(TRANSFER, ["3", "4"], overrides)
+
+    def remove_tracks():
+        backend.install(dest)
+        run_script(DELETE, ["1", "DELETE"], overrides)
+
+    def remove_playlists():
+        backend.install(dest)
+        run_script(DELETE, ["4", "DELETE"], overrides)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        cwd = os.getcwd()
+        os.chdir(work_dir)
+        try:
+            scenario("fetch_all", size, fetch)
+            # The import scenarios read the files written by the export
+            if only & {"export", "add_simple_items", "import_playlists_cloned"}:
+                scenario("export", favorites + playlist_tracks, export)
+                if "export" not in only:
+                    measure(backend, "export", 0, export, False, args.verbose)
+            scenario("add_simple_items", size, import_tracks)
+            scenario("import_playlists_cloned", playlist_tracks, import_playlists)
+            if "remove_items" in only:
+                if not dest.favorites["tracks"]:
+                    dest.favorites["tracks"] = dict(source.favorites["tracks"])
+                scenario("remove_items", len(dest.favorites["tracks"]), remove_tracks)
+            if "process_playlists" in only:
+                # A few playlists of other users, to be unfollowed instead of deleted
+                for n in range(max(1, args.playlists // 5)):
+                    dest.add_playlist(FakePlaylist(backend, f"Followed {n}", "", [], 99))
+                scenario("process_playlists", len(dest.favorites["playlists"]), remove_playlists)
+        finally:
+            os.chdir(cwd)
+    return results
+
+# ─────────────────────────────────────────────
+# REPORT
+# ─────────────────────────────────────────────
+def print_report(results):
+    header = f"{'size':>7} {'scenario':<24} {'items':>7} {'requests':>8} {'429':>5} {'500':>5} " \
+             f"{'wall s':>8} {'items/s':>9} {'peak MB':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        peak = f"{r['peak_mb']:.2f}" if r["peak_mb"] is not None else "-"
+        print(f"{r['size']:>7} {r['scenario']:<24} {r['items']:>7} {r['requests']:>8} {r['throttled']:>5} "
+              f"{r['errors']:>5} {r['wall_s']:>8.2f} {r['items_per_s'] or 0:>9.1f} {peak:>8}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmarks against a simulated Tidal backend.")
+    parser.add_argument("--sizes", default="1000,10000", help="Library sizes (favorite tracks), comma separated")
+    parser.add_argument("--only", help=f"Scenarios to run, comma separated: {','.join(SCENARIOS)}")
+    parser.add_argument("--latency", type=float, default=0.005, help="Seconds per simulated request")
+    parser.add_argument("--rate-limit", type=float, default=0, help="Server requests/s before 429 (0 = off)")
+    parser.add_argument("--retry-after", type=float, default=1, help="Retry-After seconds sent with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failing with 500")
+    parser.add_argument("--fail-reads", action="store_true", help="Send 429 / 500 for reads too, not only writes")
+    parser.add_argument("--unavailable-rate", type=float, default=0.0, help="Share of IDs that cannot be added")
+    parser.add_argument("--max-page", type=int, default=100, help="Server side page size cap")
+    parser.add_argument("--playlists", type=int, default=10, help="Playlists in the source library")
+    parser.add_argument("--playlist-size", type=int, default=200, help="Tracks per playlist")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                        help="Override a script setting, e.g. --set IMPORT_WORKERS=8 (repeatable)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-memory", action="store_true", help="Skip tracemalloc (it slows Python down)")
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the scripts' own output")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    overrides = dict(item.split("=", 1) for item in args.set)
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        results.extend(run_size(size, args, overrides))
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=4)
@@ -0,0 +1,239 @@
+import sqlite3
+import json
+import os
+import sys
+
+# ─────────────────────────────────────────────
+# CONFIGURATION
+# ─────────────────────────────────────────────
+ARCHIVE_FILE = "library_archive.db"
+SEPARATOR = " :: "  # Same separator as the *_id_list.txt files
+READ_BATCH = 500    # Rows read per query when streaming from the archive
+
+# Table -> text file used by the transfer script
+TEXT_FILES = {
+    "albums": "album_id_list.txt",
+    "artists": "artist_id_list.txt",
+    "tracks": "track_id_list.txt",
+}
+PLAYLIST_FILES = ("playlists_export.json", "playlists_export.jsonl")
+
+# ─────────────────────────────────────────────
+# SCHEMA
+# ─────────────────────────────────────────────
+# ordinal keeps the export order (oldest favorite first), status tracks the
+# transfer: 'pending' after export, 'added' or 'failed' after import
+ITEM_TABLE = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id      TEXT PRIMARY KEY,
+    ordinal INTEGER NOT NULL,
+    meta    TEXT,
+    status  TEXT NOT NULL DEFAULT 'pending',
+    error   TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS {table}_ordinal ON {table}(ordinal);
+"""
+
+PLAYLIST_TABLES = """
+CREATE TABLE IF NOT EXISTS playlists (
+    id          TEXT PRIMARY KEY,
+    ordinal     INTEGER NOT NULL,
+    name        TEXT NOT NULL,
+    description TEXT,
+    status      TEXT NOT NULL DEFAULT 'pending',
+    dest_id     TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS playlists_ordinal ON playlists(ordinal);
+CREATE TABLE IF NOT EXISTS playlist_entries (
+    playlist_id TEXT NOT NULL,
+    position    INTEGER NOT NULL,
+    track_id    TEXT NOT NULL,
+    meta        TEXT,
+    isrc        TEXT,
+    PRIMARY KEY (playlist_id, position)
+) WITHOUT ROWID;
+"""
+
+def open_archive(path=ARCHIVE_FILE):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    script = "".join(ITEM_TABLE.format(table=table) for table in TEXT_FILES) + PLAYLIST_TABLES
+    conn.executescript(script)
+    # Archives written before ISRCs were exported
+    if "isrc" not in {row[1] for row in conn.execute("PRAGMA table_info(playlist_entries)")}:
+        conn.execute("ALTER TABLE playlist_entries ADD COLUMN isrc TEXT")
+    return conn
+
+# ─────────────────────────────────────────────
+# WRITE (export)
+# ─────────────────────────────────────────────
+def write_items(conn, table, rows):
+    # rows: iterable of (id, meta) in export order, replaces the whole table
+    with conn:
+        conn.execute(f"DELETE FROM {table}")
+        conn.executemany(f"INSERT OR REPLACE INTO {table} (id, ordinal, meta) VALUES (?, ?, ?)",
+                         ((str(item_id), ordinal, meta) for ordinal, (item_id, meta) in enumerate(rows)))
+
+def playlist_key(index, record):
+    # Starsze eksporty nie mają ID playlisty źródłowej
+    return record.get('id') or f"{index}:{record['name']}"
+
+def write_playlists(conn, records):
+    # records: iterable of {id, name, description, tracks}, replaces all playlists
+    with conn:
+        conn.execute("DELETE FROM playlist_entries")
+        conn.execute("DELETE FROM playlists")
+        for ordinal, record in enumerate(records):
+            pl_id = playlist_key(ordinal, record)
+            conn.execute("INSERT OR REPLACE INTO playlists (id, ordinal, name, description) VALUES (?, ?, ?, ?)",
+                         (pl_id, ordinal, record['name'], record.get('description')))
+            entries = []
+            for position, t in enumerate(record.get('tracks', [])):
+                if isinstance(t, dict):
+                    entries.append((pl_id, position, str(t['id']), t.get('meta'), t.get('isrc')))
+                else:
+                    entries.append((pl_id, position, str(t), None, None))
+            conn.executemany("INSERT OR REPLACE INTO playlist_entries (playlist_id, position, track_id, meta, isrc) "
+                             "VALUES (?, ?, ?, ?, ?)", entries)
+
+# ─────────────────────────────────────────────
+# READ (import)
+# ─────────────────────────────────────────────
+def has_rows(conn, table):
+    return conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() is not None
+
+def count_items(conn, table, pending=False):
+    where = " WHERE status != 'added'" if pending else ""
+    return conn.execute(f"SELECT COUNT(*) FROM {table}{where}").fetchone()[0]
+
+def iter_items(conn, table, pending=False):
+    # Yields (id, meta) in export order. Reads READ_BATCH rows at a time by
+    # ordinal, so statuses can be updated on the same connection meanwhile.
+    where = "AND status != 'added'" if pending else ""
+    last = -1
+    while True:
+        rows = conn.execute(f"SELECT ordinal, id, meta FROM {table} WHERE ordinal > ? {where} "
+                            f"ORDER BY ordinal LIMIT ?", (last, READ_BATCH)).fetchall()
+        if not rows:
+            return
+        for ordinal, item_id, meta in rows:
+            yield item_id, meta
+        last = rows[-1][0]
+
+def get_meta(conn, table, item_id):
+    row = conn.execute(f"SELECT meta FROM {table} WHERE id = ?", (str(item_id),)).fetchone()
+    return row[0] if row else None
+
+def iter_playlists(conn):
+    # Yields playlist records in the same shape as playlists_export.json
+    last = -1
+    while True:
+        rows = conn.execute("SELECT ordinal, id, name, description FROM playlists WHERE ordinal > ? "
+                            "ORDER BY ordinal LIMIT ?", (last, READ_BATCH)).fetchall()
+        if not rows:
+            return
+        for ordinal, pl_id, name, description in rows:
+            entries = conn.execute("SELECT track_id, meta, isrc FROM playlist_entries WHERE playlist_id = ? "
+                                   "ORDER BY position", (pl_id,))
+            tracks = []
+            for track_id, meta, isrc in entries:
+                track = {"id": track_id, "meta": meta}
+                if isrc:
+                    track["isrc"] = isrc
+                tracks.append(track)
+            yield {
+                "id": pl_id,
+                "name": name,
+                "description": description,
+                "tracks": tracks,
+            }
+        last = rows[-1][0]
+
+# ─────────────────────────────────────────────
+# STATUS (transfer progress)
+# ─────────────────────────────────────────────
+def mark_items(conn, table, ids, status, error=None):
+    conn.executemany(f"UPDATE {table} SET status = ?, error = ? WHERE id = ?",
+                     ((status, error, str(item_id)) for item_id in ids))
+
+def mark_playlist(conn, pl_id, status, dest_id=None):
+    conn.execute("UPDATE playlists SET status = ?, dest_id = ? WHERE id = ?", (status, dest_id, pl_id))
+
+# ─────────────────────────────────────────────
+# CONVERTERS (text/JSON files <-> archive)
+# ─────────────────────────────────────────────
+def read_text_rows(filename):
+    with open(filename, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line: continue
+            if SEPARATOR in line:
+                item_id, meta = line.split(SEPARATOR, 1)
+                yield item_id.strip(), meta.strip()
+            else:
+                # Stary format (tylko ID)
+                yield line, None
+
+def iter_playlist_export(path):
+    if path.endswith(".jsonl"):
+        # Czytamy po jednej playliście, bez ładowania całego pliku
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line: continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # Last line can be cut in half by a crash
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+
+def files_to_archive(conn, directory="."):
+    for table, filename in TEXT_FILES.items():
+        path = os.path.join(directory, filename)
+        if os.path.exists(path):
+            write_items(conn, table, read_text_rows(path))
+            print(f"  {filename} -> {table}: {count_items(conn, table)} rows")
+    # Both formats can be there (pipelined mode writes JSONL), the newest one is used
+    paths = [os.path.join(directory, f) for f in PLAYLIST_FILES if os.path.exists(os.path.join(directory, f))]
+    if paths:
+        path = max(paths, key=os.path.getmtime)
+        write_playlists(conn, iter_playlist_export(path))
+        print(f"  {os.path.basename(path)} -> playlists: {count_items(conn, 'playlists')} rows")
+
+def archive_to_files(conn, directory="."):
+    for table, filename in TEXT_FILES.items():
+        if not has_rows(conn, table):
+            continue
+        with open(os.path.join(directory, filename), "w", encoding="utf-8") as f:
+            for item_id, meta in iter_items(conn, table):
+                f.write(f"{item_id}{SEPARATOR}{meta}\n" if meta is not None else f"{item_id}\n")
+        print(f"  {table} -> {filename}")
+    if has_rows(conn, "playlists"):
+        with open(os.path.join(directory, PLAYLIST_FILES[0]), "w", encoding="utf-8") as f:
+            json.dump(list(iter_playlists(conn)), f, ensure_ascii=False, indent=4)
+        print(f"  playlists -> {PLAYLIST_FILES[0]}")
+
+# ─────────────────────────────────────────────
+# COMMAND LINE
+# ─────────────────────────────────────────────
+# python tidal_archive.py pack [archive.db]    txt/JSON files -> archive
+# python tidal_archive.py unpack [archive.db]  archive -> txt/JSON files
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("pack", "unpack"):
+        print("Usage: python tidal_archive.py pack|unpack [archive file]")
+        sys.exit(1)
+    path = sys.argv[2] if len(sys.argv) > 2 else ARCHIVE_FILE
+    if sys.argv[1] == "unpack" and not os.path.exists(path):
+        print(f"File {path} not found.")
+        sys.exit(1)
+    conn = open_archive(path)
+    if sys.argv[1] == "pack":
+        print(f"Packing export files into {path}...")
+        files_to_archive(conn)
+    else:
+        print(f"Unpacking {path}...")
+        archive_to_files(conn)
+    conn.close()
@@ -0,0 +1,1150 @@
+from array import array
+from bisect import bisect_left
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+import tidalapi
+from tidalapi.exceptions import TooManyRequests, ObjectNotFound
+from tqdm import tqdm
+import json
+import os
+import random
+import threading
+import time
+import requests
+
+# ─────────────────────────────────────────────
+# CONFIGURATION (defaults, scripts can override per call)
+# ─────────────────────────────────────────────
+PAGE_SIZE = 50
+FETCH_WORKERS = 4
+IMPORT_WORKERS = 4
+RATE_LIMIT = 10        # Requests per second shared by all workers
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0     # Seconds, doubled on every retry
+BACKOFF_MAX = 60.0
+ORDER_WINDOW = 4       # Requests (batches or single items) sent concurrently before waiting, when order matters
+JOURNAL_SYNC_EVERY = 200   # Journal records written before forcing them to disk
+JOURNAL_SYNC_INTERVAL = 2.0  # ...or seconds since the last fsync, whichever comes first
+TOKEN_FILE = "tidal_sessions.json"  # Saved logins per profile (keep it private)
+REFRESH_MARGIN = 600   # Seconds before expiry when the access token is refreshed
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)  # Histogram upper bounds in seconds
+MATCH_CACHE_FILE = "rematch_cache.json"  # Re-matching results kept between runs
+MATCH_CACHE_DAYS = 30  # Cached matches (and misses) older than this are looked up again
+CODE_BATCH = 20        # ISRCs / UPCs looked up in one catalogue request
+
+# ─────────────────────────────────────────────
+# METRICS (per-endpoint latency, retries, throughput)
+# ─────────────────────────────────────────────
+class Metrics:
+    # One per process (tidal_utils.metrics), shared by all worker threads.
+    # Endpoints are filled by the session wrappers from instrument(), phases
+    # by fetch_all / iter_pages / run_bulk and the scripts.
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.endpoints = {}
+            self.phases = {}
+            self.finished = False
+
+    def _endpoint(self, name):
+        stats = self.endpoints.get(name)
+        if stats is None:
+            stats = self.endpoints[name] = {
+                "requests": 0, "errors": 0, "throttled": 0, "retries": 0,
+                "bytes_sent": 0, "bytes_received": 0, "seconds": 0.0, "max": 0.0,
+                "buckets": [0] * (len(self.buckets) + 1),  # Last one is +Inf
+            }
+        return stats
+
+    def timed(self, name, fn, on_result=None):
+        # Wraps one API call. Calls made inside it (tidalapi calling its own
+        # wrapped methods) are counted as part of the outer endpoint.
+        def call(*args, **kwargs):
+            if getattr(self.local, "endpoint", None):
+                return fn(*args, **kwargs)
+            self.local.endpoint = name
+            start = time.perf_counter()
+            error = None
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                error = e
+                e.endpoint = name  # For the retry counter in call_with_retry
+                raise
+            finally:
+                self.local.endpoint = None
+                self.observe(name, time.perf_counter() - start, error)
+            return on_result(result) if on_result else result
+        return call
+
+    def observe(self, name, seconds, error=None):
+        with self.lock:
+            stats = self._endpoint(name)
+            stats["requests"] += 1
+            stats["seconds"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+            stats["buckets"][bisect_left(self.buckets, seconds)] += 1
+            if error is not None:
+                stats["errors"] += 1
+                if http_status(error) == 429:
+                    stats["throttled"] += 1
+
+    def retried(self, error):
+        with self.lock:
+            self._endpoint(getattr(error, "endpoint", "other"))["retries"] += 1
+
+    def count_bytes(self, response, *args, **kwargs):
+        # requests response hook, runs in the thread that made the call
+        body = response.request.body if response.request is not None else None
+        with self.lock:
+            stats = self._endpoint(getattr(self.local, "endpoint", None) or "other")
+            stats["bytes_sent"] += len(body) if body else 0
+            stats["bytes_received"] += len(response.content or b"")
+
+    def record_phase(self, name, items, started):
+        # started: time.monotonic() when the phase began, repeated phases add up
+        with self.lock:
+            phase = self.phases.setdefault(name, {"items": 0, "seconds": 0.0})
+            phase["items"] += items
+            phase["seconds"] += time.monotonic() - started
+
+    def _quantile(self, stats, q):
+        # Upper bound of the bucket holding the q-th call, max for the last bucket
+        rank = q * stats["requests"]
+        seen = 0
+        for bound, count in zip(self.buckets, stats["buckets"]):
+            seen += count
+            if seen >= rank:
+                return min(bound, stats["max"])
+        return stats["max"]
+
+    def snapshot(self):
+        with self.lock:
+            endpoints = {}
+            for name, stats in sorted(self.endpoints.items()):
+                calls = stats["requests"]
+                endpoints[name] = {
+                    **{k: v for k, v in stats.items() if k not in ("buckets", "seconds", "max")},
+                    "seconds": round(stats["seconds"], 3),
+                    "avg_ms": round(1000 * stats["seconds"] / calls, 1) if calls else None,
+                    "p50_ms": round(1000 * self._quantile(stats, 0.5), 1) if calls else None,
+                    "p95_ms": round(1000 * self._quantile(stats, 0.95), 1) if calls else None,
+                    "max_ms": round(1000 * stats["max"], 1),
+                    "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], stats["buckets"])),
+                }
+            phases = {
+                name: {"items": p["items"], "seconds": round(p["seconds"], 3),
+                       "items_per_s": round(p["items"] / p["seconds"], 1) if p["seconds"] else None}
+                for name, p in self.phases.items()
+            }
+        return {
+            "started": datetime.fromtimestamp(self.started, timezone.utc).isoformat(timespec="seconds"),
+            "duration_s": round(time.time() - self.started, 3),
+            "endpoints": endpoints,
+            "phases": phases,
+        }
+
+    def print_summary(self, snap):
+        print("\n--- API CALLS ---")
+        print(f"  {'endpoint':<40} {'calls':>7} {'errors':>6} {'429':>5} {'retries':>7} "
+              f"{'avg ms':>8} {'p95 ms':>8} {'max ms':>8} {'KB':>9}")
+        for name, e in snap["endpoints"].items():
+            kb = (e["bytes_sent"] + e["bytes_received"]) / 1024
+            print(f"  {name:<40} {e['requests']:>7} {e['errors']:>6} {e['throttled']:>5} {e['retries']:>7} "
+                  f"{e['avg_ms'] or 0:>8.1f} {e['p95_ms'] or 0:>8.1f} {e['max_ms']:>8.1f} {kb:>9.1f}")
+        if snap["phases"]:
+            print(f"  {'phase':<40} {'items':>7} {'seconds':>9} {'items/s':>9}")
+            for name, p in snap["phases"].items():
+                print(f"  {name:<40} {p['items']:>7} {p['seconds']:>9.1f} {p['items_per_s'] or 0:>9.1f}")
+        print(f"  Run time: {snap['duration_s']:.1f}s")
+
+    def write_json(self, snap, path, job):
+        # One line per run, so nightly runs can be compared
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"job": job, **snap}, ensure_ascii=False) + "\n")
+
+    def write_prometheus(self, snap, path, job):
+        # Textfile for node_exporter's textfile collector, replaced atomically
+        def labels(**values):
+            return "{" + ",".join(f'{k}="{_prom_escape(v)}"' for k, v in values.items()) + "}"
+
+        lines = []
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, label_values, value in samples:
+                lines.append(f"{name}{suffix}{labels(job=job, **label_values)} {value}")
+
+        endpoints = snap["endpoints"]
+        histogram = []
+        for name, e in endpoints.items():
+            cumulative = 0
+            for bound, count in e["buckets"].items():
+                cumulative += count
+                histogram.append(("_bucket", {"endpoint": name, "le": bound}, cumulative))
+            histogram.append(("_sum", {"endpoint": name}, e["seconds"]))
+            histogram.append(("_count", {"endpoint": name}, e["requests"]))
+        metric("tidal_request_duration_seconds", "histogram", "API call latency by endpoint.", histogram)
+        for key, name, help_text in (
+                ("errors", "tidal_request_errors_total", "API calls that raised an error."),
+                ("throttled", "tidal_requests_throttled_total", "API calls answered with 429."),
+                ("retries", "tidal_request_retries_total", "API calls repeated after a transient error."),
+                ("bytes_sent", "tidal_bytes_sent_total", "Request body bytes."),
+                ("bytes_received", "tidal_bytes_received_total", "Response body bytes.")):
+            metric(name, "counter", help_text, [("", {"endpoint": n}, e[key]) for n, e in endpoints.items()])
+        phases = snap["phases"]
+        metric("tidal_phase_items", "gauge", "Items processed in a phase of the last run.",
+               [("", {"phase": n}, p["items"]) for n, p in phases.items()])
+        metric("tidal_phase_duration_seconds", "gauge", "Time spent in a phase of the last run.",
+               [("", {"phase": n}, p["seconds"]) for n, p in phases.items()])
+        metric("tidal_run_duration_seconds", "gauge", "Duration of the last run.", [("", {}, snap["duration_s"])])
+        metric("tidal_run_timestamp_seconds", "gauge", "End of the last run (unix time).",
+               [("", {}, round(time.time()))])
+
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, path)
+
+    def finish(self, job, json_path=None, prom_path=None):
+        # Summary to stdout + metric files. The scripts call it at the end and
+        # register it with atexit for runs that stop early, it only runs once.
+        if self.finished or (not self.endpoints and not self.phases):
+            return
+        self.finished = True
+        snap = self.snapshot()
+        self.print_summary(snap)
+        try:
+            if json_path:
+                self.write_json(snap, json_path, job)
+            if prom_path:
+                self.write_prometheus(snap, prom_path, job)
+        except OSError as e:
+            print(f"  Could not write metrics: {e}")
+
+metrics = Metrics()
+
+def _prom_escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _path_endpoint(method, path):
+    # "users/123/favorites/tracks/1,2" -> "DELETE users/{id}/favorites/tracks/{id}"
+    parts = ["{id}" if any(c.isdigit() for c in part) else part for part in path.strip("/").split("/")]
+    return f"{method} {'/'.join(parts)}"
+
+def _instrument_playlist(pl):
+    for name in ("items", "add", "remove_by_indices", "edit"):
+        if hasattr(pl, name):
+            setattr(pl, name, metrics.timed(f"playlist.{name}", getattr(pl, name)))
+    return pl
+
+def instrument(session):
+    # Wraps the session methods the scripts call so every API call is timed
+    # by endpoint. Playlists handed out by the session are wrapped as well.
+    favorites = session.user.favorites
+    for name in ("tracks", "albums", "artists", "get_tracks_count", "get_albums_count",
+                 "get_artists_count", "get_playlists_count", "add_track", "add_album", "add_artist",
+                 "remove_track", "remove_album", "remove_artist", "remove_playlist"):
+        if hasattr(favorites, name):
+            setattr(favorites, name, metrics.timed(f"favorites.{name}", getattr(favorites, name)))
+    favorites.playlists = metrics.timed("favorites.playlists", favorites.playlists,
+                                        lambda page: [_instrument_playlist(pl) for pl in page or []])
+    session.playlist = metrics.timed("session.playlist", session.playlist, _instrument_playlist)
+    for name in ("search", "get_tracks_by_isrc", "get_albums_by_barcode"):
+        if hasattr(session, name):
+            setattr(session, name, metrics.timed(f"session.{name}", getattr(session, name)))
+    session.user.create_playlist = metrics.timed("user.create_playlist", session.user.create_playlist,
+                                                 _instrument_playlist)
+    raw_request = session.request.request
+    session.request.request = lambda method, path, *args, **kwargs: \
+        metrics.timed(_path_endpoint(method, path), raw_request)(method, path, *args, **kwargs)
+
+    http = getattr(session, "request_session", None)
+    if http is not None:
+        http.hooks["response"].append(metrics.count_bytes)
+    return session
+
+# ─────────────────────────────────────────────
+# LOGIN (saved sessions per profile)
+# ─────────────────────────────────────────────
+_token_lock = threading.Lock()
+
+def _utcnow():
+    # tidalapi keeps expiry_time as naive UTC
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def load_tokens(path=TOKEN_FILE):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_tokens(session, profile, path=TOKEN_FILE):
+    with _token_lock:
+        tokens = load_tokens(path)
+        tokens[profile] = {
+            "token_type": session.token_type,
+            "access_token": session.access_token,
+            "refresh_token": session.refresh_token,
+            "expiry_time": session.expiry_time.isoformat() if session.expiry_time else None,
+            "is_pkce": bool(getattr(session, 'is_pkce', False)),
+        }
+        tmp = path + ".tmp"
+        # Tokens give full access to the account, only the owner may read them
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(tokens, f, indent=4)
+        os.replace(tmp, path)
+
+def _restore(session, saved):
+    expiry = datetime.fromisoformat(saved["expiry_time"]) if saved.get("expiry_time") else None
+    token_type, access_token = saved["token_type"], saved["access_token"]
+    refresh_token = saved.get("refresh_token")
+    session.is_pkce = saved.get("is_pkce", False)
+    if refresh_token and expiry and expiry - _utcnow() < timedelta(seconds=REFRESH_MARGIN):
+        # Odświeżamy przed wczytaniem, żeby nie zaczynać z wygasającym tokenem
+        if not session.token_refresh(refresh_token):
+            return False
+        token_type, access_token, expiry = session.token_type, session.access_token, session.expiry_time
+    return session.load_oauth_session(token_type, access_token, refresh_token, expiry,
+                                      is_pkce=saved.get("is_pkce", False))
+
+class TokenKeeper:
+    # Background thread that refreshes the access token REFRESH_MARGIN seconds
+    # before it expires and saves the new one, so long imports never hit an
+    # expired token (tidalapi would only refresh after a request failed).
+    def __init__(self, session, profile, path=TOKEN_FILE):
+        self.session = session
+        self.profile = profile
+        self.path = path
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _seconds_left(self):
+        if not self.session.expiry_time or not self.session.refresh_token:
+            return None
+        left = (self.session.expiry_time - _utcnow()).total_seconds() - REFRESH_MARGIN
+        return max(0.0, left)
+
+    def refresh(self):
+        if self.session.token_refresh(self.session.refresh_token):
+            save_tokens(self.session, self.profile, self.path)
+            return True
+        return False
+
+    def _run(self):
+        while True:
+            wait = self._seconds_left()
+            if wait is None or self.stopped.wait(wait):
+                return
+            try:
+                if self.refresh():
+                    continue
+            except Exception as e:
+                tqdm.write(f"  [WARN] Could not refresh the login '{self.profile}': {e}")
+            if self.stopped.wait(60):
+                return
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.session.access_token:
+            # tidalapi may have refreshed the token on its own meanwhile
+            save_tokens(self.session, self.profile, self.path)
+
+def login(profile, force=False, path=TOKEN_FILE):
+    # Restores the saved login of this profile, or runs the device login and
+    # saves it. Returns (session, keeper), call keeper.stop() at the end.
+    session = tidalapi.Session()
+    saved = None if force else load_tokens(path).get(profile)
+    restored = False
+    if saved:
+        try:
+            restored = _restore(session, saved)
+        except Exception as e:
+            print(f"  Saved login '{profile}' could not be used ({e}).")
+    if restored:
+        print(f"  Using saved login '{profile}' (user {session.user.id}).")
+    else:
+        session.login_oauth_simple()
+    save_tokens(session, profile, path)
+    instrument(session)
+    return session, TokenKeeper(session, profile, path).start()
+
+# ─────────────────────────────────────────────
+# PAGINATION (Universal)
+# ─────────────────────────────────────────────
+def _item_key(item):
+    item_id = getattr(item, 'id', None)
+    return str(item_id) if item_id is not None else id(item)
+
+def _dedupe(items):
+    # Offsets shift when the library changes mid-fetch, so a page can repeat items
+    seen = set()
+    unique = []
+    for item in items:
+        key = _item_key(item)
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(item)
+    return unique
+
+def _fetch_serial(fetch_fn, pbar, page_size, offset=0, total=None):
+    items = []
+    while total is None or offset < total:
+        batch = fetch_fn(limit=page_size, offset=offset)
+        if not batch:
+            break
+        items.extend(batch)
+        offset += len(batch)
+        pbar.update(len(batch))
+        if total is None and len(batch) < page_size:
+            break
+    return items
+
+def _fetch_parallel(fetch_fn, total, pbar, page_size, workers):
+    offsets = list(range(0, total, page_size))
+    pages = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch_fn, limit=page_size, offset=o): o for o in offsets}
+        for future in as_completed(futures):
+            batch = future.result() or []
+            pages[futures[future]] = batch
+            pbar.update(len(batch))
+
+    # Składamy strony z powrotem w kolejności offsetów
+    items = []
+    for offset in offsets:
+        items.extend(pages[offset])
+
+    # The library grew while we were fetching: keep reading past the old total
+    last = pages[offsets[-1]]
+    if len(last) == page_size:
+        items.extend(_fetch_serial(fetch_fn, pbar, page_size, offset=offsets[-1] + page_size))
+    return items
+
+def paged(fetch_fn, limiter=None, retries=MAX_RETRIES):
+    # Page requests go through the account's limiter and are retried after
+    # 429 / server errors, one throttled page must not end the whole download
+    return lambda limit, offset: call_with_retry(lambda: fetch_fn(limit=limit, offset=offset), limiter, retries)
+
+def fetch_all(fetch_fn, count_fn, label, page_size=PAGE_SIZE, workers=FETCH_WORKERS, desc="Downloading",
+              limiter=None, retries=MAX_RETRIES):
+    started = time.monotonic()
+    count = count_fn
+    items = _fetch_all(paged(fetch_fn, limiter, retries), lambda: call_with_retry(count, limiter, retries),
+                       label, page_size, workers, desc)
+    metrics.record_phase(f"{desc} {label}", len(items), started)
+    return items
+
+def _fetch_all(fetch_fn, count_fn, label, page_size, workers, desc):
+    try:
+        total = count_fn()
+    except:
+        total = 0
+
+    print(f'  Found {total} {label}.')
+
+    if total == 0:
+        return []
+
+    with tqdm(total=total, desc=f'  {desc} {label}', unit='items') as pbar:
+        if workers <= 1 or total <= page_size:
+            return _fetch_serial(fetch_fn, pbar, page_size, total=total)
+
+        items = _dedupe(_fetch_parallel(fetch_fn, total, pbar, page_size, workers))
+
+        try:
+            new_total = count_fn()
+        except:
+            new_total = total
+
+        if new_total != total or len(items) != new_total:
+            # Items were added or removed during the fetch and shifted the offsets
+            # we computed: pages skip live items or repeat removed ones, even when
+            # the item count still adds up. Re-read sequentially to get the real list.
+            tqdm.write(f"  [WARN] {label} changed during fetch ({total} -> {new_total}), re-reading sequentially...")
+            pbar.reset(total=new_total)
+            items = _dedupe(_fetch_serial(fetch_fn, pbar, page_size))
+    return items
+
+def prefetch_pages(fetch_fn, total, pool, page_size=PAGE_SIZE, ahead=FETCH_WORKERS):
+    # Yields pages in offset order while up to `ahead` later pages are already
+    # being fetched on `pool`. Reads past `total` if the last page comes back full.
+    offsets = iter(range(0, total, page_size))
+    in_flight = deque()
+    for offset in offsets:
+        in_flight.append((offset, pool.submit(fetch_fn, limit=page_size, offset=offset)))
+        if len(in_flight) >= ahead:
+            break
+
+    offset, batch = 0, []
+    while in_flight:
+        offset, future = in_flight.popleft()
+        batch = future.result() or []
+        next_offset = next(offsets, None)
+        if next_offset is not None:
+            in_flight.append((next_offset, pool.submit(fetch_fn, limit=page_size, offset=next_offset)))
+        if batch:
+            yield batch
+
+    # The list grew while we were reading: keep going past the old total
+    offset += len(batch)
+    while len(batch) == page_size:
+        batch = fetch_fn(limit=page_size, offset=offset) or []
+        if not batch:
+            break
+        yield batch
+        offset += len(batch)
+
+def iter_pages(fetch_fn, count_fn, label, page_size=PAGE_SIZE, workers=FETCH_WORKERS, desc="Downloading",
+               limiter=None, retries=MAX_RETRIES):
+    # Streaming version of fetch_all: yields pages in offset order and keeps
+    # at most `workers` pages in flight, so memory does not grow with the library
+    fetch_fn = paged(fetch_fn, limiter, retries)
+    try:
+        total = call_with_retry(count_fn, limiter, retries)
+    except:
+        total = 0
+
+    print(f'  Found {total} {label}.')
+
+    if total == 0:
+        return
+
+    started = time.monotonic()
+    fetched = 0
+    try:
+        with tqdm(total=total, desc=f'  {desc} {label}', unit='items') as pbar, \
+                ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for batch in prefetch_pages(fetch_fn, total, pool, page_size, max(1, workers)):
+                pbar.update(len(batch))
+                fetched += len(batch)
+                yield batch
+    finally:
+        metrics.record_phase(f"{desc} {label}", fetched, started)
+
+def ordered_map(fn, items, workers, ahead=None):
+    # Lazy pool.map: runs fn on `workers` threads, keeps at most `ahead` results
+    # pending and returns them in input order
+    ahead = ahead or workers * 2
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(fn, item))
+            if len(pending) >= ahead:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+# ─────────────────────────────────────────────
+# RATE LIMITING & RETRIES
+# ─────────────────────────────────────────────
+class RateLimiter:
+    # Token bucket shared by all worker threads talking to one account
+    def __init__(self, rate=RATE_LIMIT, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        # After a 429 every worker has to wait, not only the one that got it
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+def http_status(error):
+    if isinstance(error, TooManyRequests):
+        return 429
+    while error is not None:
+        response = getattr(error, 'response', None)
+        if response is not None and getattr(response, 'status_code', None):
+            return response.status_code
+        error = error.__cause__
+    return None
+
+def retry_after(error):
+    seconds = getattr(error, 'retry_after', -1)
+    if seconds is not None and seconds > 0:
+        return seconds
+    cause = error.__cause__
+    response = getattr(cause, 'response', None)
+    if response is not None:
+        try:
+            return float(response.headers.get("Retry-After", 0)) or None
+        except (TypeError, ValueError):
+            return None
+    return None
+
+def is_transient(error):
+    status = http_status(error)
+    if status is None:
+        return isinstance(error, (requests.ConnectionError, requests.Timeout))
+    return status == 429 or status >= 500
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+def call_with_retry(fn, limiter=None, retries=MAX_RETRIES):
+    attempt = 0
+    while True:
+        if limiter:
+            limiter.acquire()
+        try:
+            return fn()
+        except Exception as e:
+            if not is_transient(e) or attempt >= retries:
+                e.attempts = attempt + 1  # For the failure log
+                raise
+            delay = retry_after(e) if http_status(e) == 429 else None
+            if delay is None:
+                delay = backoff_delay(attempt)
+            metrics.retried(e)
+            if limiter and http_status(e) == 429:
+                limiter.pause(delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
+
+# ─────────────────────────────────────────────
+# CONCURRENT IMPORT ENGINE
+# ─────────────────────────────────────────────
+class ImportReport:
+    def __init__(self):
+        self.added = []
+        self.failed = []      # (id, error) - rejected, retrying will not help
+        self.transient = []   # (id, error) - still failing after all retries, worth another run
+
+def send_batch(batch, batch_fn, limiter=None, retries=MAX_RETRIES):
+    # Sends many IDs in one request. A rejected batch is split in half and each
+    # half is retried, so k bad IDs cost about k*log(n) extra requests.
+    # Returns [(id, error)], error is None for IDs that went through.
+    try:
+        call_with_retry(lambda: batch_fn(list(batch)), limiter, retries)
+        return [(item_id, None) for item_id in batch]
+    except Exception as e:
+        if len(batch) == 1 or is_transient(e):
+            return [(item_id, e) for item_id in batch]
+    half = len(batch) // 2
+    return send_batch(batch[:half], batch_fn, limiter, retries) + \
+        send_batch(batch[half:], batch_fn, limiter, retries)
+
+def _send_single(item_id, fn, limiter, retries):
+    try:
+        call_with_retry(lambda: fn(item_id), limiter, retries)
+        return [(item_id, None)]
+    except Exception as e:
+        return [(item_id, e)]
+
+def chunked(items, size):
+    # Lazy chunks, works on lists, generators and queues alike
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+def run_bulk(ids, fn, label, workers=IMPORT_WORKERS, limiter=None, retries=MAX_RETRIES,
+             ordered=False, window=ORDER_WINDOW, on_error=None, batch_size=1, desc="Adding",
+             on_success=None, total=None):
+    # fn gets one ID, or a list of up to batch_size IDs when batch_size > 1.
+    # ids can be any iterable (e.g. a queue being filled by an export), pass
+    # total for the progress bar when it has no len().
+    report = ImportReport()
+    started = time.monotonic()
+    if total is None and hasattr(ids, '__len__'):
+        total = len(ids)
+        if not total:
+            return report
+
+    if batch_size > 1:
+        units = chunked(ids, batch_size)
+        task = lambda unit: send_batch(unit, fn, limiter, retries)
+    else:
+        units = iter(ids)
+        task = lambda unit: _send_single(unit, fn, limiter, retries)
+
+    # In ordered mode units are sent in windows and each window finishes before
+    # the next one starts, so date-added order can only shuffle inside a window.
+    # The window counts units (a batch keeps its own order), so it can keep
+    # every worker busy whatever the batch size is.
+    if ordered:
+        windows = chunked(units, max(1, window))
+    else:
+        windows = [units]
+
+    def collect(done):
+        for future in done:
+            results = future.result()
+            for item_id, error in results:
+                if error is None:
+                    report.added.append(item_id)
+                    if on_success:
+                        on_success(item_id)
+                    continue
+                if is_transient(error):
+                    report.transient.append((item_id, error))
+                else:
+                    report.failed.append((item_id, error))
+                if on_error:
+                    on_error(item_id, error)
+            pbar.update(len(results))
+
+    max_pending = max(1, workers) * 4
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool, \
+            tqdm(total=total, desc=f"  {desc} {label}", unit='items') as pbar:
+        for chunk in windows:
+            pending = set()
+            for unit in chunk:
+                pending.add(pool.submit(task, unit))
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+            collect(as_completed(pending))
+    metrics.record_phase(f"{desc} {label}", len(report.added) + len(report.failed) + len(report.transient), started)
+    return report
+
+# ─────────────────────────────────────────────
+# METADATA LOOKUP (read from the export file on demand)
+# ─────────────────────────────────────────────
+class MetaIndex:
+    # Numeric ID -> byte offset of its "ID :: meta" line, kept in two sorted
+    # int64 arrays (16 bytes per item). Built on the first lookup, and extended
+    # when an ID is missing and the file has grown since (pipelined export).
+    def __init__(self, path, separator):
+        self.path = path
+        self.separator = separator.encode("utf-8")
+        self.ids = array('q')
+        self.offsets = array('q')
+        self.end = 0
+
+    def _extend(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) <= self.end:
+            return False
+        ids, offsets = list(self.ids), list(self.offsets)
+        with open(self.path, "rb") as f:
+            f.seek(self.end)
+            offset = self.end
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Line still being written
+                item_id = line.split(self.separator, 1)[0].strip()
+                if item_id.isdigit():
+                    ids.append(int(item_id))
+                    offsets.append(offset)
+                offset += len(line)
+        self.end = offset
+        if len(ids) == len(self.ids):
+            return False
+        order = sorted(range(len(ids)), key=ids.__getitem__)
+        self.ids = array('q', (ids[i] for i in order))
+        self.offsets = array('q', (offsets[i] for i in order))
+        return True
+
+    def _find(self, key):
+        i = bisect_left(self.ids, key)
+        return self.offsets[i] if i < len(self.ids) and self.ids[i] == key else None
+
+    def get(self, item_id):
+        item_id = str(item_id).strip()
+        if not item_id.isdigit():
+            return None
+        key = int(item_id)
+        offset = self._find(key)
+        if offset is None and self._extend():
+            offset = self._find(key)
+        if offset is None:
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            parts = f.readline().decode("utf-8").split(self.separator.decode("utf-8"), 1)
+        return parts[1].strip() if len(parts) == 2 else None
+
+# ─────────────────────────────────────────────
+# CHECKPOINT JOURNAL (for --resume)
+# ─────────────────────────────────────────────
+class JournalState:
+    def __init__(self):
+        self.added = {}       # category -> set of IDs already added
+        self.playlists = {}   # source playlist key -> {"id": new playlist ID, "offset": tracks added}
+        self.exported = set() # categories whose export file is complete
+
+def load_journal(path):
+    # One pass over the journal, later records win
+    state = JournalState()
+    if not os.path.exists(path):
+        return state
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue  # Last line can be cut in half by a crash
+            kind = rec.get("t")
+            if kind == "add":
+                state.added.setdefault(rec["cat"], set()).add(rec["id"])
+            elif kind == "playlist":
+                state.playlists[rec["key"]] = {"id": rec["id"], "offset": 0}
+            elif kind == "offset" and rec["key"] in state.playlists:
+                state.playlists[rec["key"]]["offset"] = rec["offset"]
+            elif kind == "exported":
+                state.exported.add(rec["cat"])
+    return state
+
+class Journal:
+    # Append-only log of finished work. Records are flushed and fsynced in
+    # batches, a crash loses at most the last batch which is just re-sent.
+    def __init__(self, path, append=False, sync_every=JOURNAL_SYNC_EVERY, sync_interval=JOURNAL_SYNC_INTERVAL):
+        torn = False
+        if append and os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+        self.file = open(path, "a" if append else "w", encoding="utf-8")
+        if torn:
+            self.file.write("\n")
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.pending = 0
+        self.last_sync = time.monotonic()
+        self.lock = threading.Lock()
+
+    def record(self, sync=False, **entry):
+        with self.lock:
+            self.file.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+            self.pending += 1
+            if sync or self.pending >= self.sync_every or \
+                    time.monotonic() - self.last_sync >= self.sync_interval:
+                self._sync()
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self._sync()
+                self.file.close()
+
+# ─────────────────────────────────────────────
+# PLAYLIST DIFF (LCS based)
+# ─────────────────────────────────────────────
+def lcs_pairs(a, b):
+    # Longest common subsequence as (index in a, index in b) pairs.
+    # Hunt-Szymanski: playlists rarely repeat a track, so this stays close
+    # to O(n log n) instead of the O(n*m) table.
+    positions = {}
+    for j, x in enumerate(b):
+        positions.setdefault(x, []).append(j)
+
+    tails = []       # tails[k] = smallest b index ending a common subsequence of length k+1
+    tail_nodes = []  # (i, j, previous node) for rebuilding the pairs
+    for i, x in enumerate(a):
+        for j in reversed(positions.get(x, ())):
+            k = bisect_left(tails, j)
+            node = (i, j, tail_nodes[k - 1] if k else None)
+            if k == len(tails):
+                tails.append(j)
+                tail_nodes.append(node)
+            else:
+                tails[k] = j
+                tail_nodes[k] = node
+
+    pairs = []
+    node = tail_nodes[-1] if tail_nodes else None
+    while node:
+        pairs.append((node[0], node[1]))
+        node = node[2]
+    return pairs[::-1]
+
+def playlist_diff(existing, target):
+    # Returns (indices to remove from existing, [(position, [ids])] to insert).
+    # Tracks outside the LCS that are on both lists are moves: removed from
+    # the old place and inserted at the new one.
+    pairs = lcs_pairs(existing, target)
+    kept_existing = {i for i, _ in pairs}
+    kept_target = {j for _, j in pairs}
+
+    removes = [i for i in range(len(existing)) if i not in kept_existing]
+    inserts = []
+    j = 0
+    while j < len(target):
+        if j in kept_target:
+            j += 1
+            continue
+        start = j
+        while j < len(target) and j not in kept_target:
+            j += 1
+        inserts.append((start, target[start:j]))
+    return removes, inserts
+
+def count_moves(existing, removes, inserts):
+    removed = {}
+    for i in removes:
+        removed[existing[i]] = removed.get(existing[i], 0) + 1
+    moves = 0
+    for _, ids in inserts:
+        for item_id in ids:
+            if removed.get(item_id):
+                removed[item_id] -= 1
+                moves += 1
+    return moves
+
+def add_to_playlist(pl, batch, allow_duplicates=False, position=-1, present=()):
+    # UserPlaylist.add sends onArtifactNotFound=SKIP: unavailable tracks are
+    # left out without an error, only addedItemIds tells which ones. Returns
+    # (tracks added, [(id, error)] for the skipped ones). Without duplicates,
+    # IDs in present or earlier in the batch are skipped as duplicates, not failures.
+    before = pl.num_tracks
+    added = pl.add(batch, allow_duplicates=allow_duplicates, position=position)
+    count = pl.num_tracks - before
+    if count >= len(batch) or not isinstance(added, (list, tuple)):
+        return count, []
+    left = Counter(str(i) for i in added)
+    seen = set(present)
+    skipped = []
+    for tid in batch:
+        if left[tid] > 0:
+            left[tid] -= 1
+        elif allow_duplicates or tid not in seen:
+            skipped.append((tid, ObjectNotFound(f"Track {tid} was skipped by Tidal (not available)")))
+        if not allow_duplicates:
+            seen.add(tid)
+    return count, skipped
+
+def apply_playlist_diff(pl, removes, inserts, limiter=None, retries=MAX_RETRIES, chunk_size=100):
+    # Removals go first, highest index first so lower indices stay valid.
+    # After that the playlist is the LCS in target order and each insert
+    # position is already final. Returns [(id, error)] for tracks that failed.
+    failures = []
+    removes = sorted(removes, reverse=True)
+    for start in range(0, len(removes), chunk_size):
+        chunk = removes[start:start + chunk_size]
+        call_with_retry(lambda: pl.remove_by_indices(chunk), limiter, retries)
+
+    missing = 0  # Tracks that could not be inserted shift later positions
+    for position, ids in inserts:
+        cursor = [position - missing]
+
+        def insert(batch):
+            count, skipped = add_to_playlist(pl, batch, allow_duplicates=True, position=cursor[0])
+            cursor[0] += count
+            failures.extend(skipped)
+
+        for start in range(0, len(ids), chunk_size):
+            for tid, error in send_batch(ids[start:start + chunk_size], insert, limiter, retries):
+                if error is not None:
+                    failures.append((tid, error))
+        missing = position + len(ids) - cursor[0]
+    return failures
+
+# ─────────────────────────────────────────────
+# RE-MATCHING (ISRC / UPC / search for unavailable IDs)
+# ─────────────────────────────────────────────
+class MatchCache:
+    # Persistent "key -> replacement ID" map, None = nothing found. Keys are
+    # "tracks:<source id>", "isrc:<code>", "upc:<code>" and "search:<kind>:<query>",
+    # so overlapping playlists and later runs never repeat a lookup.
+    def __init__(self, path=MATCH_CACHE_FILE, max_age_days=MATCH_CACHE_DAYS):
+        self.path = path
+        self.max_age = max_age_days * 86400
+        self.lock = threading.Lock()
+        self.changed = False
+        self.entries = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                print(f"  [WARN] {path} is damaged, starting with an empty match cache.")
+
+    def get(self, key):
+        # Returns (found, value), expired entries count as not found
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None or time.time() - entry[1] > self.max_age:
+            return False, None
+        return True, entry[0]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = [value, round(time.time())]
+            self.changed = True
+
+    def save(self):
+        with self.lock:
+            if not self.path or not self.changed:
+                return
+            now = time.time()
+            entries = {k: v for k, v in self.entries.items() if now - v[1] <= self.max_age}
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entries, f, separators=(",", ":"))
+            os.replace(tmp, self.path)
+            self.changed = False
+
+def _normalize(text):
+    return " ".join((text or "").casefold().split())
+
+class Rematcher:
+    # Finds the same track / album on the destination account for IDs that
+    # could not be added: by ISRC / UPC first (CODE_BATCH codes per request),
+    # then by searching title and artist. Safe to use from worker threads.
+    CODES = {"tracks": ("isrc", "tracks", "filter[isrc]", "isrc"),
+             "albums": ("upc", "albums", "filter[barcodeId]", "barcodeId")}
+
+    def __init__(self, session, cache, limiter=None, retries=MAX_RETRIES, workers=IMPORT_WORKERS,
+                 batch_size=CODE_BATCH):
+        self.session = session
+        self.cache = cache
+        self.limiter = limiter
+        self.retries = retries
+        self.workers = workers
+        self.batch_size = batch_size
+
+    def known(self, kind, item_id):
+        # Replacement found by an earlier run, without any request
+        found, value = self.cache.get(f"{kind}:{item_id}")
+        return value if found else None
+
+    def match(self, kind, wanted):
+        # wanted: [(source id, ISRC / UPC or None, title, artist)]
+        # Returns {source id: replacement id} for the items that were found.
+        # Lookups that failed with a temporary error are not cached.
+        prefix = self.CODES[kind][0]
+        results = {}
+        todo = []
+        for item_id, code, title, artist in wanted:
+            found, value = self.cache.get(f"{kind}:{item_id}")
+            if found:
+                results[item_id] = value
+            else:
+                todo.append((item_id, code, title, artist))
+
+        # 1. ISRC / UPC, uncached codes in batches
+        by_code = {}
+        for code in {code for _, code, _, _ in todo if code}:
+            found, value = self.cache.get(f"{prefix}:{code}")
+            if found:
+                by_code[code] = value
+        missing = sorted({code for _, code, _, _ in todo if code} - by_code.keys())
+        for found in ordered_map(lambda batch: self._lookup_codes(kind, batch),
+                                 chunked(missing, self.batch_size), self.workers):
+            for code, value in found.items():
+                by_code[code] = value
+                self.cache.put(f"{prefix}:{code}", value)
+
+        # 2. Search the rest (no code in the export, or the code is not in this region)
+        queries = {}
+        for item_id, code, title, artist in todo:
+            if code and code not in by_code:
+                continue  # Code lookup failed for now
+            if by_code.get(code):
+                results[item_id] = by_code[code]
+            elif title:
+                queries.setdefault((title, artist or ""), []).append(item_id)
+            else:
+                results[item_id] = None
+        for query, (found, value) in zip(queries, ordered_map(lambda q: self._search(kind, *q),
+                                                               queries, self.workers)):
+            if found:
+                for item_id in queries[query]:
+                    results[item_id] = value
+
+        for item_id, _, _, _ in todo:
+            if item_id in results:
+                self.cache.put(f"{kind}:{item_id}", results[item_id])
+        self.cache.save()
+        return {item_id: value for item_id, value in results.items() if value and value != item_id}
+
+    def _lookup_codes(self, kind, codes):
+        # One catalogue request for many codes. When the API does not take the
+        # batch, tidalapi's one-code-per-request helpers are used instead.
+        _, path, param, attribute = self.CODES[kind]
+        try:
+            response = call_with_retry(lambda: self.session.request.request(
+                "GET", path, params={param: codes}, base_url=self.session.config.openapi_v2_location),
+                self.limiter, self.retries)
+            found = dict.fromkeys(codes)
+            for entry in response.json().get("data") or []:
+                code = (entry.get("attributes") or {}).get(attribute)
+                if len(codes) == 1 and code is None:
+                    code = codes[0]
+                if code in found and found[code] is None:
+                    found[code] = str(entry["id"])
+            return found
+        except Exception as e:
+            if is_transient(e):
+                return {}
+        found = {}
+        for code in codes:
+            try:
+                lookup = self.session.get_tracks_by_isrc if kind == "tracks" else self.session.get_albums_by_barcode
+                items = call_with_retry(lambda: lookup(code), self.limiter, self.retries)
+                found[code] = str(items[0].id) if items else None
+            except Exception as e:
+                if not is_transient(e):
+                    found[code] = None  # Not in the catalogue or invalid code
+        return found
+
+    def _search(self, kind, title, artist):
+        # Returns (found, id): the first result with the same title and artist
+        key = f"search:{kind}:{_normalize(title)}|{_normalize(artist)}"
+        found, value = self.cache.get(key)
+        if found:
+            return True, value
+        model = tidalapi.Track if kind == "tracks" else tidalapi.Album
+        try:
+            results = call_with_retry(lambda: self.session.search(f"{title} {artist}".strip(), models=[model],
+                                                                  limit=10), self.limiter, self.retries)
+        except Exception as e:
+            if is_transient(e):
+                return False, None
+            results = {}
+        value = None
+        for item in results.get(kind) or []:
+            item_artist = getattr(getattr(item, "artist", None), "name", "")
+            if _normalize(item.name) == _normalize(title) and \
+                    (not artist or _normalize(item_artist) == _normalize(artist)):
+                value = str(item.id)
+                break
+        self.cache.put(key, value)
+        return True, value